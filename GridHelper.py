@@ -1,15 +1,78 @@
-def calc_size(grid_parameters: dict) -> dict:
+MAX_SIZE = 16  # the largest grid (16x16, digits 1-16)
+
+
+def box_shape(size: int) -> tuple[int, int]:
+    """
+    the default box of a grid size, as square as possible and wider than tall
+    (4 -> 2x2, 6 -> 2x3, 9 -> 3x3, 12 -> 3x4, 16 -> 4x4)
+
+    :param size: the number of rows (cols) of the grid
+    :return: (rows, cols) of a box
+    """
+    box_rows = int(size ** 0.5)
+    while size % box_rows:
+        box_rows -= 1
+    return box_rows, size // box_rows
+
+
+def grid_shape(json_data: dict) -> tuple[int, tuple[int, int]]:
+    """
+    the grid size and the box shape of a puzzle,
+    from the optional "size" and "box" keys (9 and 3x3 if not given)
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :return: the size, and (rows, cols) of a box
+    """
+    size = json_data.get('size', 9)
+    box = json_data.get('box')
+    if box is None:
+        return size, box_shape(size)
+    return size, (box[0], box[1])
+
+
+def line_box(json_data: dict) -> tuple[int, int]:
+    """
+    the box drawn by the bold grid lines, a jigsaw puzzle has none
+    (its whole grid is one box, the bold region borders are drawn separately)
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :return: (rows, cols) of a box
+    """
+    size, box = grid_shape(json_data)
+    if json_data.get('regions'):
+        return size, size
+    return box
+
+
+def regions_key(regions):
+    """
+    convert regions (lists of coords, e.g. from json) to nested tuples, to be used as a cache key
+
+    :param regions: All regions in the grid, or None
+    :return: tuple of regions, each region is a tuple of (row, col), None if regions is None
+    """
+    if regions is None:
+        return None
+    return tuple(tuple(tuple(coord) for coord in region) for region in regions)
+
+
+def calc_size(grid_parameters: dict, grid_size: int = 9, box: tuple = (3, 3)) -> dict:
     """
     calculates additional parameters using the given grid parameters dict
 
     :param grid_parameters: dict of drawing parameters
+    :param grid_size: the number of rows (cols) of the grid
+    :param box: (rows, cols) of a box
     :return: the same dict with some new parameters
     """
-    # calculate overall grid size
+    grid_parameters['grid_size'] = grid_size
+    grid_parameters['box'] = box
+
+    # calculate overall grid size (the longer side if the boxes are not square)
     size = (grid_parameters['white_boarder_width'] * 2 +  # two white boarders (left/right & top/bottom)
-            grid_parameters['cell_size'] * 9 +  # nine cells each direction
-            grid_parameters['main_width'] * 4 +  # four bold lines each direction (separates all boxes)
-            grid_parameters['inside_width'] * 6)  # another six lines each direction (separates all cells)
+            grid_parameters['cell_size'] * grid_size +  # cells each direction
+            grid_parameters['main_width'] * (grid_size // min(box) + 1) +  # bold lines (separates all boxes)
+            grid_parameters['inside_width'] * (grid_size - grid_size // min(box)))  # lines (separates all cells)
 
     # first boarder position
     cur_position = (grid_parameters['white_boarder_width'] +  # one white boarders (left & top)
@@ -22,21 +85,32 @@ def calc_size(grid_parameters: dict) -> dict:
     size = int(size * grid_parameters['scale'])  # final size = scale
     grid_parameters['size'] = size
 
-    boarders = [cur_position]  # inside boarders
+    # inside boarders, cols (x) are separated by the box width and rows (y) by the box height
+    grid_parameters['boarders'] = calc_boarders(grid_parameters, cur_position, grid_size, box[1])
+    grid_parameters['y_boarders'] = calc_boarders(grid_parameters, cur_position, grid_size, box[0])
+
+    return grid_parameters
+
 
-    for i in range(9):
+def calc_boarders(grid_parameters: dict, cur_position: float, grid_size: int, box_len: int) -> list:
+    """
+    the positions of the cell boarders along one direction
+
+    :param grid_parameters: dict of drawing parameters
+    :param cur_position: the left/top most point of the first cell
+    :param grid_size: the number of cells in this direction
+    :param box_len: the number of cells in a box in this direction
+    :return: list of grid_size + 1 boarders
+    """
+    boarders = [cur_position]
+    for i in range(grid_size):
         cur_position += grid_parameters['cell_size']
-        if i in (2, 5, 8):  # bold line position
+        if (i + 1) % box_len == 0:  # bold line position
             cur_position += grid_parameters['main_width']
         else:  # normal line position
             cur_position += grid_parameters['inside_width']
         boarders.append(cur_position)
-
-    # cur_position += grid_parameters['cell_size']
-    # boarders.append(cur_position)
-    grid_parameters['boarders'] = boarders
-
-    return grid_parameters
+    return boarders
 
 
 def select_idx(x: float, y: float, boarders: list, y_boarders = None) -> tuple[int, int]:
@@ -54,7 +128,7 @@ def select_idx(x: float, y: float, boarders: list, y_boarders = None) -> tuple[i
         y_boarders = boarders
 
     ind_row, ind_col = -1, -1
-    for i in range(9):
+    for i in range(len(y_boarders) - 1):
         if ind_row != -1:
             break
         range_start = y_boarders[i]
@@ -62,7 +136,7 @@ def select_idx(x: float, y: float, boarders: list, y_boarders = None) -> tuple[i
         if range_start <= y <= range_end:
             ind_row = i
 
-    for i in range(9):
+    for i in range(len(boarders) - 1):
         if ind_col != -1:
             break
         range_start = boarders[i]
@@ -74,17 +148,21 @@ def select_idx(x: float, y: float, boarders: list, y_boarders = None) -> tuple[i
     return ind_row, ind_col
 
 
-def calc_center_coord(cell: tuple[int, int], boarders: list, cell_size: float) -> tuple[float, float]:
+def calc_center_coord(cell: tuple[int, int], boarders: list, cell_size: float,
+                      y_boarders = None) -> tuple[float, float]:
     """
     calculates the drawing coordinates of the center of a given cell
 
     :param cell: the selected cell index
     :param boarders: the boarders of different cells (in drawing coordinates)
     :param cell_size: the size (in graph) of each cell
+    :param y_boarders: the y-axis boarders of different cells (if differ from x-axis boarders)
     :return: the drawing coordinates of the center of the cell
     """
+    if y_boarders is None:
+        y_boarders = boarders
     coord_x = boarders[cell[1]] + cell_size / 2
-    coord_y = boarders[cell[0]] + cell_size / 2
+    coord_y = y_boarders[cell[0]] + cell_size / 2
     return coord_x, coord_y
 
 
@@ -96,19 +174,78 @@ def create_sum_group(cell_cages: list) -> list:
     :return: list containing all sum groups
     """
     sum_grps = []
-    unique_grps = set([cell_cages[i][j]['group'] for i in range(9) for j in range(9)])
+    size = len(cell_cages)
+    unique_grps = set([cell_cages[i][j]['group'] for i in range(size) for j in range(size)])
     for grp in unique_grps:
         if grp == -1:
             continue
         unique_sum = set([cell_cages[i][j]['sum']
-                          for i in range(9)
-                          for j in range(9)
+                          for i in range(size)
+                          for j in range(size)
                           if cell_cages[i][j]['group'] == grp and 'sum' in cell_cages[i][j]])
         if len(unique_sum) != 1:
             return []
         sum_coords = [(i, j)
-                      for i in range(9)
-                      for j in range(9)
+                      for i in range(size)
+                      for j in range(size)
                       if cell_cages[i][j]['group'] == grp]
         sum_grps.append({'coords': sum_coords, 'sum': list(unique_sum)[0]})
     return sum_grps
+
+
+def check_ks_data(json_data: dict) -> (bool, dict):
+    """
+    check the killer sudoku cage groups and known numbers (in the format of the saved json)
+    and convert all coords to tuples
+
+    :param json_data: json dict containing cage groups and known numbers
+    :return: whether it is a complete puzzle, and the converted json dict
+    """
+    size, box = grid_shape(json_data)
+    if size not in range(1, MAX_SIZE + 1) or box[0] * box[1] != size:
+        raise ValueError("Invalid grid size or box shape")
+
+    if json_data.get('regions'):  # jigsaw: irregular regions instead of the boxes
+        if len(json_data['regions']) != size or any(len(region) != size for region in json_data['regions']):
+            raise ValueError("Invalid regions")
+        json_data['regions'] = [[tuple(coord) for coord in region] for region in json_data['regions']]
+        region_coords = set(coord for region in json_data['regions'] for coord in region)
+        if region_coords != set((i, j) for i in range(size) for j in range(size)):
+            raise ValueError("Invalid regions")
+
+    if 'known_numbers' in json_data:
+        num_of_known_numbers = len(json_data['known_numbers'])
+
+        for i in range(num_of_known_numbers):
+            json_data['known_numbers'][i]['coord'] = tuple(json_data['known_numbers'][i]['coord'])
+
+    if 'sum_groups' in json_data:
+        exist_coords = set()
+        all_sum = 0
+        num_of_cage_groups = len(json_data['sum_groups'])
+
+        for i in range(num_of_cage_groups):
+            num_of_cells = len(json_data['sum_groups'][i]['coords'])
+            for j in range(num_of_cells):
+                coord = tuple(json_data['sum_groups'][i]['coords'][j])
+                if coord[0] not in range(size) or coord[1] not in range(size):
+                    raise ValueError("coord not in range")
+
+                if coord in exist_coords:
+                    raise ValueError("Duplicate coords")
+
+                json_data['sum_groups'][i]['coords'][j] = coord
+                exist_coords.add(coord)
+            all_sum += json_data['sum_groups'][i]['sum']
+
+        if all_sum != size * size * (size + 1) // 2:
+            print("WARNING: Total Sum is not " + str(size * size * (size + 1) // 2) + "!")
+            return False, json_data
+        elif len(exist_coords) != size * size:
+            print("WARNING: Not all cells included")
+            return False, json_data
+
+    if json_data:
+        return True, json_data
+    else:
+        return False, json_data
@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+from GridHelper import check_ks_data, grid_shape
+from KillerEngine import check_unique
+from SudokuSolve import solve_with_stats
+
+
+def iter_puzzles(source: str):
+    """
+    read all puzzles from a folder of saved json files or a JSONL file (one puzzle per line)
+
+    :param source: path of the folder or the JSONL file
+    :return: generator of (name, json dict) of every puzzle
+    """
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            if not filename.endswith('.json'):
+                continue
+            with open(os.path.join(source, filename), 'r') as f:
+                yield filename[:-5], json.load(f)
+    else:
+        with open(source, 'r') as f:
+            for i, line in enumerate(f):
+                if line.strip():
+                    json_data = json.loads(line)
+                    yield json_data.get('name', f'{os.path.basename(source)}:{i + 1}'), json_data
+
+
+def solve_one(name: str, json_data: dict, solver_cfg: dict, unique: bool = False) -> dict:
+    """
+    solve one puzzle (in a worker process)
+
+    :param name: the name of the puzzle
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param solver_cfg: The config of the solver
+    :param unique: also check whether the solution is unique (with the built-in engine,
+    None if it gave up, see KillerEngine.UNIQUE_NODES)
+    :return: the result record of the puzzle
+    """
+    tic = time.time()
+    record = {'name': name}
+    try:
+        _status, json_data = check_ks_data(json_data)
+        if not _status:
+            raise ValueError('Incomplete puzzle')
+        if 'known_numbers' not in json_data:
+            json_data['known_numbers'] = []
+        if unique:
+            record['unique'], _solns = check_unique(json_data)
+            known_nbrs = _solns[0] if _solns else []
+        else:
+            known_nbrs, record['stats'] = solve_with_stats(json_data, solver_cfg.copy())
+        record['solved'] = len(known_nbrs) == grid_shape(json_data)[0] ** 2
+        record['known_numbers'] = [{'coord': list(known_nbr['coord']),
+                                    'small': known_nbr['small'],
+                                    'possible_numbers': known_nbr['possible_numbers']}
+                                   for known_nbr in known_nbrs]
+    except Exception as e:
+        record['solved'] = False
+        record['error'] = str(e)
+    record['time'] = time.time() - tic
+    return record
+
+
+def batch_solve(source: str, output: str, solver_cfg: dict, workers: int = None, unique: bool = False) -> int:
+    """
+    solve all puzzles from the source with a process pool,
+    every result is written to the output JSONL file as soon as it is finished
+
+    :param source: path of the folder or the JSONL file of puzzles
+    :param output: path of the output JSONL file
+    :param solver_cfg: The config of the solver
+    :param workers: number of worker processes (None or 0 means all cores)
+    :param unique: also check whether the solutions are unique
+    :return: number of puzzles solved
+    """
+    tic = time.time()
+    workers = workers or os.cpu_count()
+    puzzles = iter_puzzles(source)
+    nbr_done, nbr_solved = 0, 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(output, 'w') as f:
+        pending = set()
+        for name, json_data in puzzles:
+            pending.add(executor.submit(solve_one, name, json_data, solver_cfg, unique))
+            # keep a few puzzles per worker queued, so a large archive is not read all at once
+            if len(pending) < workers * 4:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                nbr_done += 1
+                nbr_solved += record['solved']
+
+        for future in as_completed(pending):
+            record = future.result()
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            nbr_done += 1
+            nbr_solved += record['solved']
+
+    toc = time.time() - tic
+    print(f'Solved {nbr_solved}/{nbr_done} puzzles in {toc:.3f}s ({nbr_done / max(toc, 1e-9):.1f} puzzles/s)')
+    return nbr_solved
+
+
+def main():
+    with open("config.json") as f:
+        configs = json.load(f)
+    batch_cfg = configs.get("batch", {})
+
+    parser = argparse.ArgumentParser(description='Solve all killer sudoku puzzles in a folder or a JSONL file')
+    parser.add_argument('source', help='folder of saved json puzzles or a JSONL file')
+    parser.add_argument('output', help='output JSONL file, one result per line')
+    parser.add_argument('-w', '--workers', type=int, default=batch_cfg.get("workers"),
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('-u', '--unique', action='store_true',
+                        help='check the solutions are unique (stops at the second solution)')
+    args = parser.parse_args()
+
+    batch_solve(args.source, args.output, configs["solver"], args.workers, args.unique)
+
+
+if __name__ == "__main__":
+    main()
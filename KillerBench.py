@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from GridHelper import check_ks_data, grid_shape
+from KillerBatch import iter_puzzles
+from SolverPortfolio import backend_name
+from SudokuSolve import solve_with_stats
+
+BENCH_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench')
+# open source only, CBC ships with pulp
+DEFAULT_BACKENDS = [{"solver": "NATIVE"}, {"solver": "PULP_CBC_CMD", "msg": False}]
+
+
+def load_corpus(source: str) -> list:
+    """
+    read the benchmark puzzles, classic puzzles have known numbers only (no sum groups)
+
+    :param source: path of the folder or the JSONL file of puzzles
+    :return: list of (name, group, json dict), group is "kind-level" (e.g. "killer-hard")
+    """
+    puzzles = []
+    for name, json_data in iter_puzzles(source):
+        _status, json_data = check_ks_data(json_data)
+        if not _status:
+            print('Skipping incomplete puzzle ' + name)
+            continue
+        json_data.setdefault('sum_groups', [])
+        json_data.setdefault('known_numbers', [])
+        group = json_data.get('kind', 'killer') + '-' + json_data.get('level', 'unknown')
+        puzzles.append((name, group, json_data))
+    return puzzles
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    the nearest rank percentile
+
+    :param values: list of numbers
+    :param q: the percentile (0-100)
+    :return: the value at the percentile, None if there is no value
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def bench_backend(puzzles: list, backend: dict, repeat: int = 1) -> dict:
+    """
+    solve all puzzles with one backend (one after the other, the solution cache is off)
+
+    :param puzzles: list of (name, group, json dict), see load_corpus
+    :param backend: the solver config of the backend
+    :param repeat: number of times every puzzle is solved
+    :return: the summary: solved puzzles, p50/p95/max latency, throughput, p50 of every group
+    and the slowest puzzle
+    """
+    latencies, groups, failed = [], {}, []
+    slowest, slowest_time = None, 0
+    tic = time.time()
+    for name, group, json_data in puzzles:
+        for _ in range(repeat):
+            known_nbrs, stats = solve_with_stats(json_data, dict(backend, cache=False))
+            latencies.append(stats['total_time'])
+            groups.setdefault(group, []).append(stats['total_time'])
+            if stats['total_time'] > slowest_time:
+                slowest, slowest_time = name, stats['total_time']
+        if len(known_nbrs) != grid_shape(json_data)[0] ** 2:
+            failed.append(name)
+    toc = time.time() - tic
+
+    return {'puzzles': len(puzzles),
+            'solved': len(puzzles) - len(failed),
+            'failed': failed,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'max': max(latencies) if latencies else None,
+            'throughput': len(latencies) / max(toc, 1e-9),
+            'groups': {group: percentile(values, 50) for group, values in sorted(groups.items())},
+            'slowest': slowest}
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float = 1.5, slack: float = 0.05) -> list:
+    """
+    compare the results with the baseline, a latency regresses when it is more than
+    tolerance times the baseline and also more than slack seconds slower (timing noise of the fast solves)
+
+    :param results: dict of backend name -> summary (see bench_backend)
+    :param baseline: the stored results
+    :param tolerance: the allowed slowdown factor
+    :param slack: the allowed slowdown in seconds
+    :return: list of regression messages, empty if none
+    """
+    regressions = []
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if summary['solved'] < base['solved']:
+            regressions.append(f"{name}: solved {summary['solved']} puzzles, baseline {base['solved']}")
+        latencies = [(field, summary[field], base[field]) for field in ('p50', 'p95', 'max')]
+        latencies += [(group, value, base['groups'].get(group)) for group, value in summary['groups'].items()]
+        for field, value, base_value in latencies:
+            if value is None or base_value is None:
+                continue
+            if value > base_value * tolerance and value - base_value > slack:
+                regressions.append(f'{name}: {field} {value:.4f}s, baseline {base_value:.4f}s')
+    return regressions
+
+
+def main():
+    with open("config.json") as f:
+        configs = json.load(f)
+    bench_cfg = configs.get("bench", {})
+
+    parser = argparse.ArgumentParser(description='Benchmark the solver backends and compare them with the baseline')
+    parser.add_argument('-c', '--corpus', default=os.path.join(BENCH_FOLDER, 'corpus.jsonl'),
+                        help='folder of saved json puzzles or a JSONL file (default: bench/corpus.jsonl)')
+    parser.add_argument('-b', '--baseline', default=os.path.join(BENCH_FOLDER, 'baseline.json'),
+                        help='the baseline json file (default: bench/baseline.json)')
+    parser.add_argument('-s', '--solver', action='append',
+                        help='solver name to benchmark, can be repeated (default: the "bench" backends in config.json)')
+    parser.add_argument('-r', '--repeat', type=int, default=bench_cfg.get("repeat", 1),
+                        help='number of times every puzzle is solved')
+    parser.add_argument('-t', '--tolerance', type=float, default=bench_cfg.get("tolerance", 1.5),
+                        help='the allowed slowdown factor compared with the baseline')
+    parser.add_argument('--slack', type=float, default=bench_cfg.get("slack", 0.05),
+                        help='the allowed slowdown in seconds (timing noise of the fast solves)')
+    parser.add_argument('-u', '--update', action='store_true',
+                        help='store the results as the new baseline')
+    args = parser.parse_args()
+
+    if args.solver:
+        backends = [{'solver': solver} for solver in args.solver]
+    else:
+        backends = bench_cfg.get("backends", DEFAULT_BACKENDS)
+
+    puzzles = load_corpus(args.corpus)
+    results = {}
+    for backend in backends:
+        name = backend_name(backend)
+        results[name] = summary = bench_backend(puzzles, backend, args.repeat)
+        print(f"{name}: {summary['solved']}/{summary['puzzles']} solved, "
+              f"p50 {summary['p50']:.4f}s, p95 {summary['p95']:.4f}s, max {summary['max']:.4f}s, "
+              f"{summary['throughput']:.1f} puzzles/s, slowest {summary['slowest']}")
+        for group, value in summary['groups'].items():
+            print(f'    {group}: p50 {value:.4f}s')
+
+    if args.update:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4)
+        print('Baseline updated: ' + args.baseline)
+        return
+
+    if not os.path.exists(args.baseline):
+        print('No baseline, run with --update to store one')
+        return
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.tolerance, args.slack)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    if regressions:
+        sys.exit(1)
+    print('No regression')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from GridHelper import check_ks_data, grid_shape
+from SolveCache import puzzle_hash
+
+MAX_STATES = 2000  # more ties than this means a very symmetric puzzle, it is kept as it is
+
+
+def cell_codes(json_data: dict) -> list:
+    """
+    the content of every cell: (index of its sum group or -1, sum of the group, given number or 0)
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :return: 9x9 list of cell contents
+    """
+    grid = [[[-1, 0, 0] for _ in range(9)] for _ in range(9)]
+    for idx, sum_group in enumerate(json_data.get('sum_groups', [])):
+        for a, b in sum_group['coords']:
+            grid[a][b][0] = idx
+            grid[a][b][1] = sum_group['sum']
+    for known_number in json_data.get('known_numbers', []):
+        if not known_number['small']:
+            a, b = known_number['coord']
+            grid[a][b][2] = known_number['possible_numbers'][0]
+    return grid
+
+
+def label_cell(cell: list, labels: dict) -> tuple:
+    """
+    the code of a cell in the transformed grid,
+    groups are labelled in the order they first appear (row by row)
+
+    :param cell: the content of the cell (see cell_codes)
+    :param labels: labels of the groups seen so far (changed in place)
+    :return: (label, sum, given number) of the cell
+    """
+    if cell[0] == -1:
+        return -1, cell[1], cell[2]
+    if cell[0] not in labels:
+        labels[cell[0]] = len(labels)
+    return labels[cell[0]], cell[1], cell[2]
+
+
+def next_options(used: tuple) -> list:
+    """
+    which row (or col) can come next in the transformed grid:
+    the next one of the same band (stack), or the first one of a new band (stack)
+
+    :param used: rows (or cols) already in the transformed grid
+    :return: list of possible next rows (or cols)
+    """
+    if len(used) % 3 == 0:
+        used_bands = set(i // 3 for i in used)
+        return [i for i in range(9) if i // 3 not in used_bands]
+    band = used[-1] // 3
+    return [i for i in range(band * 3, band * 3 + 3) if i not in used]
+
+
+def keep_min(candidates: list) -> list:
+    """
+    keep the candidates with the smallest code (all of them if tied)
+
+    :param candidates: list of (code, state)
+    :return: list of states with the smallest code
+    """
+    best = min(code for code, _ in candidates)
+    return [state for code, state in candidates if code == best]
+
+
+def canonical_form(json_data: dict) -> (dict, dict):
+    """
+    The canonical representative of the puzzle under the sudoku symmetries:
+    transposition, band/stack permutations and row/col permutations inside a band/stack.
+    It is the transformed puzzle with the smallest grid of cell codes (row by row),
+    found greedily row by row (keeping all ties), so equivalent puzzles get the same form.
+    Only valid for the standard 9x9 grid with 3x3 boxes, other grid shapes and jigsaw puzzles
+    are returned unchanged.
+    Very symmetric puzzles (e.g. almost empty grids) have too many ties, they are returned unchanged too
+    (identity transform).
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :return: the canonical json dict, and the transform
+    {'transpose': bool, 'rows': [...], 'cols': [...]}: canonical cell (i, j) is the cell
+    (rows[i], cols[j]) of the (transposed if needed) original grid
+    """
+    size, box = grid_shape(json_data)
+    if (size, box) != (9, (3, 3)) or json_data.get('regions'):
+        return json_data, {'transpose': False, 'rows': list(range(size)), 'cols': list(range(size))}
+
+    codes = cell_codes(json_data)
+    grids = {False: codes, True: [[codes[j][i] for j in range(9)] for i in range(9)]}
+
+    # the first row decides the order of the cols
+    candidates = []
+    for transpose, grid in grids.items():
+        for first_row in range(9):
+            states = [((), {})]
+            for _ in range(9):
+                if len(states) > MAX_STATES:
+                    break
+                step = []
+                for cols, labels in states:
+                    for col in next_options(cols):
+                        new_labels = dict(labels)
+                        step.append((label_cell(grid[first_row][col], new_labels), (cols + (col,), new_labels)))
+                states = keep_min(step)
+            for cols, labels in states:
+                code = tuple(label_cell(grid[first_row][col], {}) for col in cols)
+                candidates.append((code, (transpose, (first_row,), cols, labels)))
+    states = keep_min(candidates)
+
+    # then the order of the other rows
+    for _ in range(8):
+        if len(states) > MAX_STATES or len(states[0][2]) < 9:
+            break
+        step = []
+        seen = set()
+        for transpose, rows, cols, labels in states:
+            grid = grids[transpose]
+            for row in next_options(rows):
+                new_labels = dict(labels)
+                code = tuple(label_cell(grid[row][col], new_labels) for col in cols)
+                new_rows = rows + (row,)
+                # states with the same rows used (in any order) and the same labels continue the same way
+                key = (transpose, cols, frozenset(new_rows), len(new_rows) % 3 and row // 3,
+                       tuple(sorted(new_labels.items())))
+                if key in seen:
+                    continue
+                seen.add(key)
+                step.append((code, (transpose, new_rows, cols, new_labels)))
+        states = keep_min(step)
+
+    if len(states) > MAX_STATES or len(states[0][1]) < 9 or len(states[0][2]) < 9:
+        transpose, rows, cols = False, tuple(range(9)), tuple(range(9))
+    else:
+        transpose, rows, cols, _ = states[0]
+    transform = {'transpose': transpose, 'rows': list(rows), 'cols': list(cols)}
+
+    canonical = {'sum_groups': [], 'known_numbers': []}
+    labels = {}
+    grid = grids[transpose]
+    for i in range(9):
+        for j in range(9):
+            label, cage_sum, given = label_cell(grid[rows[i]][cols[j]], labels)
+            if label != -1:
+                if label == len(canonical['sum_groups']):
+                    canonical['sum_groups'].append({'coords': [], 'sum': cage_sum})
+                canonical['sum_groups'][label]['coords'].append((i, j))
+            if given:
+                canonical['known_numbers'].append({'coord': (i, j),
+                                                   'small': False,
+                                                   'possible_numbers': [given]})
+    return canonical, transform
+
+
+def canonical_hash(json_data: dict) -> str:
+    """
+    the hash of the canonical form, the same for all equivalent puzzles
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :return: hex digest of the canonical form
+    """
+    return puzzle_hash(canonical_form(json_data)[0])
+
+
+def map_to_canonical(known_nbrs: list, transform: dict) -> list:
+    """
+    move known numbers of the original puzzle to the canonical puzzle
+
+    :param known_nbrs: list of known numbers in the original puzzle
+    :param transform: the transform returned by canonical_form
+    :return: list of known numbers in the canonical puzzle
+    """
+    row_idx = {row: i for i, row in enumerate(transform['rows'])}
+    col_idx = {col: j for j, col in enumerate(transform['cols'])}
+    result = []
+    for known_nbr in known_nbrs:
+        a, b = known_nbr['coord']
+        if transform['transpose']:
+            a, b = b, a
+        result.append(dict(known_nbr, coord=(row_idx[a], col_idx[b])))
+    return result
+
+
+def map_from_canonical(known_nbrs: list, transform: dict) -> list:
+    """
+    move known numbers of the canonical puzzle back to the original puzzle
+
+    :param known_nbrs: list of known numbers in the canonical puzzle
+    :param transform: the transform returned by canonical_form
+    :return: list of known numbers in the original puzzle
+    """
+    result = []
+    for known_nbr in known_nbrs:
+        i, j = known_nbr['coord']
+        a, b = transform['rows'][i], transform['cols'][j]
+        if transform['transpose']:
+            a, b = b, a
+        result.append(dict(known_nbr, coord=(a, b)))
+    return sorted(result, key=lambda known_nbr: known_nbr['coord'])
+
+
+def dedup_puzzles(source: str, workers: int = None) -> dict:
+    """
+    group all puzzles of a folder (or JSONL file) which are the same up to the sudoku symmetries
+
+    :param source: path of the folder or the JSONL file of puzzles
+    :param workers: number of worker processes (None or 0 means all cores)
+    :return: dict of canonical hash -> list of puzzle names
+    """
+    from KillerBatch import iter_puzzles
+
+    names, puzzles = [], []
+    for name, json_data in iter_puzzles(source):
+        _status, json_data = check_ks_data(json_data)
+        names.append(name)
+        puzzles.append(json_data)
+
+    groups = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for name, key in zip(names, executor.map(canonical_hash, puzzles, chunksize=16)):
+            groups.setdefault(key, []).append(name)
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the puzzles which are the same up to the sudoku symmetries')
+    parser.add_argument('source', help='folder of saved json puzzles or a JSONL file')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    groups = dedup_puzzles(args.source, args.workers)
+    for key, names in groups.items():
+        if len(names) > 1:
+            print(key[:12] + ': ' + ', '.join(names))
+    print(f'{sum(len(names) for names in groups.values())} puzzles, {len(groups)} unique')
+
+
+if __name__ == "__main__":
+    main()
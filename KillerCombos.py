@@ -0,0 +1,95 @@
+from functools import lru_cache
+from itertools import combinations
+
+
+@lru_cache(maxsize=None)
+def combo_table(max_digit: int = 9) -> dict:
+    """
+    every combination of distinct digits 1-max_digit, by sum and size
+
+    :param max_digit: the largest digit (the size of the grid)
+    :return: dict of (sum, size) -> list of combination masks
+    """
+    table = {}
+    for size in range(1, max_digit + 1):
+        for combo in combinations(range(1, max_digit + 1), size):
+            table.setdefault((sum(combo), size), []).append(sum(1 << (k - 1) for k in combo))
+    return table
+
+
+@lru_cache(maxsize=None)
+def cage_combos(cage_sum: int, size: int, excluded: int = 0, max_digit: int = 9) -> tuple:
+    """
+    all combinations of a cage which do not use any excluded digit
+
+    :param cage_sum: the sum of the cage
+    :param size: the number of cells in the cage
+    :param excluded: mask of the digits can not be used
+    :param max_digit: the largest digit (the size of the grid)
+    :return: tuple of combination masks
+    """
+    return tuple(mask for mask in combo_table(max_digit).get((cage_sum, size), ()) if not mask & excluded)
+
+
+@lru_cache(maxsize=None)
+def allowed_mask(cage_sum: int, size: int, excluded: int = 0, max_digit: int = 9) -> int:
+    """
+    all digits which can be used in a cage
+
+    :param cage_sum: the sum of the cage
+    :param size: the number of cells in the cage
+    :param excluded: mask of the digits can not be used
+    :param max_digit: the largest digit (the size of the grid)
+    :return: mask of the allowed digits, 0 if the cage is impossible
+    """
+    result = 0
+    for mask in cage_combos(cage_sum, size, excluded, max_digit):
+        result |= mask
+    return result
+
+
+@lru_cache(maxsize=None)
+def required_mask(cage_sum: int, size: int, excluded: int = 0, max_digit: int = 9) -> int:
+    """
+    all digits which are used in every combination of a cage
+
+    :param cage_sum: the sum of the cage
+    :param size: the number of cells in the cage
+    :param excluded: mask of the digits can not be used
+    :param max_digit: the largest digit (the size of the grid)
+    :return: mask of the required digits
+    """
+    combos = cage_combos(cage_sum, size, excluded, max_digit)
+    if not combos:
+        return 0
+    result = (1 << max_digit) - 1
+    for mask in combos:
+        result &= mask
+    return result
+
+
+def combo_list(cage_sum: int, size: int, excluded: int = 0, max_digit: int = 9) -> list:
+    """
+    all combinations of a cage as digit lists
+
+    :param cage_sum: the sum of the cage
+    :param size: the number of cells in the cage
+    :param excluded: mask of the digits can not be used
+    :param max_digit: the largest digit (the size of the grid)
+    :return: list of combinations, each one is a sorted list of digits
+    """
+    return [[k for k in range(1, max_digit + 1) if mask >> (k - 1) & 1]
+            for mask in cage_combos(cage_sum, size, excluded, max_digit)]
+
+
+def digits_mask(digits) -> int:
+    """
+    convert digits to a bit mask
+
+    :param digits: iterable of digits (1-9, or up to the size of the grid)
+    :return: the mask of the digits
+    """
+    mask = 0
+    for k in digits:
+        mask |= 1 << (k - 1)
+    return mask
@@ -0,0 +1,429 @@
+import time
+from functools import lru_cache
+
+from GridHelper import MAX_SIZE, box_shape, grid_shape, regions_key
+from KillerCombos import allowed_mask, cage_combos, digits_mask, required_mask
+
+# bit k - 1 set means digit k is still possible
+BIT_COUNT = [bin(_m).count('1') for _m in range(1 << MAX_SIZE)]
+MATCH_CELLS = 4  # cages with at most this many free cells are checked cell by cell
+UNIQUE_NODES = 5000  # check_unique gives up after this many search nodes (about 10s on a 16x16 grid)
+
+
+def default_regions(size: int = 9, box: tuple = None) -> list:
+    """
+    the boxes of a standard sudoku (the nine 3x3 boxes if not given)
+
+    :param size: the number of rows (cols) of the grid
+    :param box: (rows, cols) of a box
+    :return: list of regions, each region is a list of cell indexes
+    """
+    box_rows, box_cols = box_shape(size) if box is None else box
+    return [[(a, b) for a in range(c, c + box_rows) for b in range(d, d + box_cols)]
+            for c in range(0, size, box_rows) for d in range(0, size, box_cols)]
+
+
+def mask_digits(mask: int) -> list:
+    """
+    list all digits in a candidate mask
+
+    :param mask: candidate mask
+    :return: sorted list of digits in the mask
+    """
+    return [k for k in range(1, mask.bit_length() + 1) if mask >> (k - 1) & 1]
+
+
+def match_combo(free_masks: list, combo: int, support: list, chosen: list):
+    """
+    place the digits of a combination in the free cells of a cage, every way it fits,
+    and mark the digits used by the placements
+
+    :param free_masks: candidate masks of the free cells
+    :param combo: mask of the digits not placed yet
+    :param support: mask of the used digits of every free cell (changed in place)
+    :param chosen: the digits placed in the first free cells
+    """
+    if len(chosen) == len(free_masks):
+        for idx, bit in enumerate(chosen):
+            support[idx] |= bit
+        return
+    options = free_masks[len(chosen)] & combo
+    while options:
+        bit = options & -options
+        options ^= bit
+        chosen.append(bit)
+        match_combo(free_masks, combo ^ bit, support, chosen)
+        chosen.pop()
+
+
+@lru_cache(maxsize=1 << 16)
+def cage_masks(cage_sum: int, cell_masks: tuple, max_digit: int = 9):
+    """
+    the candidate masks of a cage after keeping only the digits of the free cells
+    which appear in a combination of the remaining sum (see KillerCombos),
+    cached as the same cage states come back again and again during the search
+
+    :param cage_sum: the sum of the cage
+    :param cell_masks: candidate masks of the cells of the cage
+    :param max_digit: the largest digit (the size of the grid)
+    :return: the new candidate masks, None if the cage can not be completed
+    """
+    remaining = cage_sum
+    free = []
+    available = 0
+    for idx, mask in enumerate(cell_masks):
+        if BIT_COUNT[mask] == 1:
+            remaining -= mask.bit_length()
+        else:
+            free.append(idx)
+            available |= mask
+    if not free:
+        return cell_masks if remaining == 0 else None
+
+    excluded = ((1 << max_digit) - 1) & ~available
+    allowed = allowed_mask(remaining, len(free), excluded, max_digit)
+    if not allowed:
+        return None
+
+    new_masks = list(cell_masks)
+    if len(free) <= MATCH_CELLS:
+        # small cages: a digit stays only if the other free cells can complete its combination
+        support = [0] * len(free)
+        for combo in cage_combos(remaining, len(free), excluded, max_digit):
+            match_combo([cell_masks[idx] for idx in free], combo, support, [])
+        for idx, mask in zip(free, support):
+            if not mask:
+                return None
+            new_masks[idx] = mask
+        return tuple(new_masks)
+
+    for idx in free:
+        new_masks[idx] &= allowed
+        if not new_masks[idx]:
+            return None
+
+    # a digit used by every combination with only one possible cell
+    required = required_mask(remaining, len(free), excluded, max_digit)
+    while required:
+        bit = required & -required
+        required ^= bit
+        places = [idx for idx in free if new_masks[idx] & bit]
+        if not places:
+            return None
+        if len(places) == 1:
+            new_masks[places[0]] = bit
+    return tuple(new_masks)
+
+
+@lru_cache(maxsize=8)
+def unit_tables(size: int = 9, regions_key: tuple = None, box: tuple = None) -> (tuple, tuple):
+    """
+    the units (rows, cols and regions) and the peers of every cell in them,
+    built once per grid shape and region layout
+
+    :param size: the number of rows (cols) of the grid
+    :param regions_key: All regions in the grid (as tuples, see GridHelper.regions_key), None for the boxes
+    :param box: (rows, cols) of a box
+    :return: tuple of units (cell indexes), and the frozenset of peers of every cell
+    """
+    regions = default_regions(size, box) if regions_key is None else regions_key
+
+    units = [tuple(i * size + j for j in range(size)) for i in range(size)]  # rows
+    units += [tuple(i * size + j for i in range(size)) for j in range(size)]  # cols
+    units += [tuple(a * size + b for a, b in region) for region in regions]
+
+    peers = [set() for _ in range(size * size)]
+    for unit in units:
+        for cell in unit:
+            peers[cell].update(unit)
+    for cell in range(size * size):
+        peers[cell].discard(cell)
+    return tuple(units), tuple(frozenset(p) for p in peers)
+
+
+class KillerEngine:
+    def __init__(self, json_data: dict, regions=None, hints=None):
+        """
+        build the unit and peer tables of a killer sudoku,
+        every cell is an index 0 to size * size - 1 (row * size + col)
+
+        :param json_data: json dictionary containing sum groups and known numbers (and the grid shape)
+        :param regions: All regions in the grid (the regions in json_data or the boxes if not given)
+        :param hints: known numbers from the player, small numbers restrict the cell,
+        large numbers are tried first (warm start)
+        """
+        n, box = grid_shape(json_data)
+        if regions is None:
+            regions = json_data.get('regions')  # jigsaw puzzles keep their regions in the json
+        self._size = n
+        self._all_digits = (1 << n) - 1
+
+        self._units, unit_peers = unit_tables(n, regions_key(regions), box)
+
+        self._cages = []
+        if 'sum_groups' in json_data:
+            for sum_group in json_data['sum_groups']:
+                self._cages.append(([a * n + b for a, b in sum_group['coords']], sum_group['sum']))
+
+        cage_cells = {}
+        for cells, _ in self._cages:
+            for cell in cells:
+                cage_cells.setdefault(cell, []).extend(cells)
+        self._peers = [tuple(unit_peers[cell].union(cage_cells[cell]).difference((cell,)))
+                       if cell in cage_cells else tuple(unit_peers[cell])
+                       for cell in range(n * n)]
+
+        self._givens = []
+        if 'known_numbers' in json_data:
+            for known_number in json_data['known_numbers']:
+                if not known_number['small']:
+                    a, b = known_number['coord']
+                    self._givens.append((a * n + b, known_number['possible_numbers'][0]))
+
+        # search statistics
+        self.nodes = 0
+        self.propagations = 0
+        self.backtracks = 0
+        self.max_nodes = None  # give up the search after this number of nodes (None for no limit)
+        self.deadline = None  # give up the search after this time.time() (None for no limit)
+        self.gave_up = False  # whether the search stopped at max_nodes or the deadline
+
+        self._notes = []
+        self._seeds = {}
+        for hint in hints or []:
+            a, b = hint['coord']
+            if hint['small'] and hint['possible_numbers']:
+                self._notes.append((a * n + b, digits_mask(hint['possible_numbers'])))
+            elif not hint['small']:
+                self._seeds[a * n + b] = hint['possible_numbers'][0]
+
+    def prune_cage(self, masks: list, cells: list, cage_sum: int, queue: list) -> bool:
+        """
+        keep only the digits of the free cells in a cage
+        which appear in a combination of the remaining sum (see cage_masks)
+
+        :param masks: candidate masks of all cells
+        :param cells: cell indexes of the cage
+        :param cage_sum: the sum of the cage
+        :param queue: cells which became solved (to be propagated)
+        :return: False if the cage can not be completed
+        """
+        new_masks = cage_masks(cage_sum, tuple([masks[cell] for cell in cells]), self._size)
+        if new_masks is None:
+            return False
+        for cell, mask in zip(cells, new_masks):
+            if mask != masks[cell]:
+                masks[cell] = mask
+                if BIT_COUNT[mask] == 1:
+                    queue.append(cell)
+        return True
+
+    def propagate(self, masks: list, queue: list) -> bool:
+        """
+        eliminate solved digits from the peers, fill hidden singles
+        and prune the cages until nothing changes
+
+        :param masks: candidate masks of all cells (changed in place)
+        :param queue: cells which became solved (to be propagated)
+        :return: False if there is a contradiction
+        """
+        self.propagations += 1
+        while True:
+            while queue:
+                cell = queue.pop()
+                bit = masks[cell]
+                for peer in self._peers[cell]:
+                    mask = masks[peer]
+                    if mask & bit:
+                        mask &= ~bit
+                        if not mask:
+                            return False
+                        masks[peer] = mask
+                        if BIT_COUNT[mask] == 1:
+                            queue.append(peer)
+
+            for unit in self._units:
+                seen_once, seen_more = 0, 0
+                for cell in unit:
+                    seen_more |= seen_once & masks[cell]
+                    seen_once |= masks[cell]
+                if seen_once != self._all_digits:
+                    return False
+                only_once = seen_once & ~seen_more
+                if not only_once:
+                    continue
+                for cell in unit:
+                    mask = masks[cell] & only_once
+                    if mask and mask != masks[cell]:
+                        if BIT_COUNT[mask] != 1:
+                            return False
+                        masks[cell] = mask
+                        queue.append(cell)
+
+            for cells, cage_sum in self._cages:
+                if not self.prune_cage(masks, cells, cage_sum, queue):
+                    return False
+
+            if not queue:
+                return True
+
+    def initial_masks(self):
+        """
+        candidate masks after placing all given numbers
+
+        :return: list of candidate masks, None if the givens are contradictory
+        """
+        masks = [self._all_digits] * (self._size * self._size)
+        queue = []
+        for cell, k in self._givens:
+            bit = 1 << (k - 1)
+            if not masks[cell] & bit:
+                return None
+            masks[cell] = bit
+            queue.append(cell)
+        for cell, mask in self._notes:
+            masks[cell] &= mask
+            if not masks[cell]:
+                return None
+            if BIT_COUNT[masks[cell]] == 1:
+                queue.append(cell)
+        if not self.propagate(masks, queue):
+            return None
+        return masks
+
+    def seeded_masks(self, masks: list):
+        """
+        candidate masks after also placing all the large numbers of the hints
+
+        :param masks: candidate masks after placing all given numbers
+        :return: list of candidate masks, None if the hints are contradictory
+        """
+        masks = masks[:]
+        queue = []
+        for cell, k in self._seeds.items():
+            bit = 1 << (k - 1)
+            if not masks[cell] & bit:
+                return None
+            masks[cell] = bit
+            queue.append(cell)
+        if not self.propagate(masks, queue):
+            return None
+        return masks
+
+    def search(self, masks: list, solutions: list, limit: int):
+        """
+        depth first search, always branching on the cell with the fewest candidates
+
+        :param masks: candidate masks of all cells (already propagated)
+        :param solutions: list collecting the solved masks
+        :param limit: stop after finding this number of solutions
+        """
+        self.nodes += 1
+        if ((self.max_nodes is not None and self.nodes > self.max_nodes)
+                or (self.deadline is not None and time.time() > self.deadline)):
+            self.gave_up = True
+            return
+        best_cell, best_count = -1, self._size + 1
+        for cell in range(len(masks)):
+            count = BIT_COUNT[masks[cell]]
+            if 1 < count < best_count:
+                best_cell, best_count = cell, count
+                if count == 2:
+                    break
+        if best_cell == -1:
+            solutions.append(masks)
+            return
+
+        digits = mask_digits(masks[best_cell])
+        if self._seeds.get(best_cell) in digits:  # the number from the hints first
+            digits.remove(self._seeds[best_cell])
+            digits.insert(0, self._seeds[best_cell])
+        for k in digits:
+            new_masks = masks[:]
+            new_masks[best_cell] = 1 << (k - 1)
+            if self.propagate(new_masks, [best_cell]):
+                self.search(new_masks, solutions, limit)
+                if len(solutions) >= limit:
+                    return
+            self.backtracks += 1
+
+    def solve(self, limit: int = 1) -> list:
+        """
+        find up to limit solutions of the puzzle
+
+        :param limit: the maximum number of solutions needed
+        :return: list of solutions, each solution is a list of size * size digits
+        """
+        solutions = []
+        masks = self.initial_masks()
+        if masks is not None and self._seeds and limit == 1:
+            # try to complete the large numbers of the hints first
+            seeded = self.seeded_masks(masks)
+            if seeded is not None:
+                self.search(seeded, solutions, limit)
+        if masks is not None and not solutions:
+            self.search(masks, solutions, limit)
+        return [[m.bit_length() for m in solution] for solution in solutions]
+
+
+def grid_to_known_numbers(grid: list) -> list:
+    """
+    convert a solved grid to the known numbers list
+
+    :param grid: list of size * size digits (row by row)
+    :return: list of all known numbers (all large)
+    """
+    size = int(round(len(grid) ** 0.5))
+    return [{'coord': (cell // size, cell % size),
+             'small': False,
+             'possible_numbers': [k]}
+            for cell, k in enumerate(grid)]
+
+
+def engine_solve(json_data: dict, regions=None, hints=None, stats: dict = None, time_limit: float = None) -> list:
+    """
+    solve the killer sudoku with the built-in bitmask engine
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param regions: All regions in the grid
+    :param hints: known numbers from the player (see KillerEngine)
+    :param stats: dict to fill with the time of each phase and the search statistics (see SudokuSolve.sudoku_solve)
+    :param time_limit: seconds before the search gives up (None for no limit)
+    :return: list of all known numbers (all large) which is the solution
+    """
+    tic = time.time()
+    engine = KillerEngine(json_data, regions, hints)
+    if time_limit is not None:
+        engine.deadline = tic + time_limit
+    toc_build = time.time()
+    solutions = engine.solve()
+    toc_solve = time.time()
+    known_nbrs = grid_to_known_numbers(solutions[0]) if solutions else []
+    if stats is not None:
+        stats.update(build_time=toc_build - tic,
+                     solve_time=toc_solve - toc_build,
+                     extract_time=time.time() - toc_solve,
+                     solver_status='Solved' if solutions else 'Not Solved' if engine.gave_up else 'Infeasible',
+                     nodes=engine.nodes,
+                     propagations=engine.propagations,
+                     backtracks=engine.backtracks)
+    return known_nbrs
+
+
+def check_unique(json_data: dict, regions=None, max_nodes: int = UNIQUE_NODES) -> (bool, list):
+    """
+    check whether the puzzle has exactly one solution,
+    the search stops as soon as a second solution is found
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param regions: All regions in the grid
+    :param max_nodes: give up after this number of search nodes (None for no limit)
+    :return: whether the solution is unique (None if the search gave up before it knew),
+    and the solutions found (none, one or two) as known numbers lists
+    """
+    engine = KillerEngine(json_data, regions)
+    engine.max_nodes = max_nodes
+    solutions = engine.solve(2)
+    if engine.gave_up and len(solutions) < 2:
+        return None, [grid_to_known_numbers(solution) for solution in solutions]
+    return len(solutions) == 1, [grid_to_known_numbers(solution) for solution in solutions]
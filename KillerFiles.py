@@ -4,6 +4,7 @@ import time
 
 import PySimpleGUI as sg
 
+from GridHelper import check_ks_data
 from KillerSVG import KillerSVG
 
 
@@ -26,42 +27,7 @@ def open_ks_file(filepath: str = '') -> (bool, dict):
         print(e)
         raise ValueError("Invalid JSON file")
 
-    if 'known_numbers' in json_data:
-        num_of_known_numbers = len(json_data['known_numbers'])
-
-        for i in range(num_of_known_numbers):
-            json_data['known_numbers'][i]['coord'] = tuple(json_data['known_numbers'][i]['coord'])
-
-    if 'sum_groups' in json_data:
-        exist_coords = []
-        all_sum = 0
-        num_of_cage_groups = len(json_data['sum_groups'])
-
-        for i in range(num_of_cage_groups):
-            num_of_cells = len(json_data['sum_groups'][i]['coords'])
-            for j in range(num_of_cells):
-                coord = json_data['sum_groups'][i]['coords'][j]
-                if coord[0] not in range(9) or coord[1] not in range(9):
-                    raise ValueError("coord not in range")
-
-                if coord in exist_coords:
-                    raise ValueError("Duplicate coords")
-
-                json_data['sum_groups'][i]['coords'][j] = tuple(coord)
-                exist_coords.append(coord)
-            all_sum += json_data['sum_groups'][i]['sum']
-
-        if all_sum != 405:
-            print("WARNING: Total Sum is not 405!")
-            return False, json_data
-        elif len(exist_coords) != 81:
-            print("WARNING: Not all cells included")
-            return False, json_data
-
-    if json_data:
-        return True, json_data
-    else:
-        return False, json_data
+    return check_ks_data(json_data)
 
 
 def save_ks_file(json_data: dict, filepath: str = "example.json"):
@@ -98,6 +64,7 @@ def save_dialog(_configs: dict, json_data: dict):
                              [sg.Checkbox(_configs["lang_dict"]["_Save_json_"], key='_Save_json_')],
                              [sg.Checkbox(_configs["lang_dict"]["_Save_svg_"], key='_Save_svg_')],
                              [sg.Checkbox(_configs["lang_dict"]["_Save_png_"], key='_Save_png_')],
+                             [sg.Checkbox(_configs["lang_dict"]["_Save_pdf_"], key='_Save_pdf_')],
                              [sg.Button(_configs["lang_dict"]["_Save_OK_"], key='_Save_OK_'),
                               sg.Button(_configs["lang_dict"]["_Save_Cancel_"], key='_Save_Cancel_')]],
                             background_color='white',
@@ -107,7 +74,7 @@ def save_dialog(_configs: dict, json_data: dict):
         return
     elif event == '_Save_OK_':
         tic = time.time()
-        if not (values['_Save_json_'] or values['_Save_svg_'] or values['_Save_png_']):
+        if not (values['_Save_json_'] or values['_Save_svg_'] or values['_Save_png_'] or values['_Save_pdf_']):
             return
         save_name = values['_Save_Input_']
         if save_name == '':
@@ -118,16 +85,19 @@ def save_dialog(_configs: dict, json_data: dict):
         
         if values['_Save_json_']:
             save_ks_file(json_data, os.path.join(_file_folder, save_name + ".json"))
-        if values['_Save_svg_'] or values['_Save_png_']:
-            ksvg = KillerSVG(_configs["grid_parameters"])
+        if values['_Save_svg_'] or values['_Save_png_'] or values['_Save_pdf_']:
+            # drawn once, every format is replayed from the same recording
+            render = KillerSVG(_configs["grid_parameters"]).render(json_data)
             png_size = 2000
-            svg_bs, img_bs = ksvg.draw(json_data, values['_Save_png_'], png_size)
             if values['_Save_png_']:
                 with open(os.path.join(_file_folder, save_name + ".png"), 'wb') as f:
-                    f.write(img_bs)
+                    f.write(render.png(png_size))
             if values['_Save_svg_']:
                 with open(os.path.join(_file_folder, save_name + ".svg"), 'wb') as f:
-                    f.write(svg_bs)
+                    f.write(render.svg())
+            if values['_Save_pdf_']:
+                with open(os.path.join(_file_folder, save_name + ".pdf"), 'wb') as f:
+                    f.write(render.pdf())
         print('Save time: ' + str(time.time() - tic))
     save_window.close()
 
@@ -146,7 +116,7 @@ def draw_file(grid_parameters: dict, json_data: dict,
     tic = time.time()
 
     ksvg = KillerSVG(grid_parameters)
-    svg_bs, img_bs = ksvg.draw(json_data, True, size)
+    img_bs = ksvg.render(json_data).ppm(size)
 
     graph.erase()
     graph.draw_image(data=img_bs, location=(0, 0))
@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+from GridHelper import box_shape
+from KillerEngine import KillerEngine
+
+# the search nodes of the engine while proving the solution is unique,
+# easy puzzles are solved by propagation alone (one node)
+LEVELS = {'easy': (1, 1),
+          'medium': (2, 40),
+          'hard': (41, 1000)}
+SPLIT_NODES = 2000  # a random layout not proved unique (or not) within this many nodes is thrown away
+MAX_ATTEMPTS = 200  # random grids tried for one puzzle, e.g. a 4x4 grid never needs the nodes of a hard level
+
+
+def full_grid(rnd: random.Random, size: int = 9, box: tuple = None) -> list:
+    """
+    a random solved grid: the pattern grid with shuffled digits, rows in the bands,
+    bands, cols in the stacks and stacks
+
+    :param rnd: the random generator
+    :param size: the number of rows (cols) of the grid
+    :param box: (rows, cols) of a box
+    :return: size x size list of digits
+    """
+    box_rows, box_cols = box or box_shape(size)
+    digits = list(range(1, size + 1))
+    rnd.shuffle(digits)
+    grid = [[digits[(box_cols * (i % box_rows) + i // box_rows + j) % size] for j in range(size)]
+            for i in range(size)]
+
+    bands = rnd.sample(range(size // box_rows), size // box_rows)
+    rows = [band * box_rows + i for band in bands for i in rnd.sample(range(box_rows), box_rows)]
+    stacks = rnd.sample(range(size // box_cols), size // box_cols)
+    cols = [stack * box_cols + j for stack in stacks for j in rnd.sample(range(box_cols), box_cols)]
+    grid = [[grid[i][j] for j in cols] for i in rows]
+    if box_rows == box_cols and rnd.random() < 0.5:
+        grid = [list(row) for row in zip(*grid)]
+    return grid
+
+
+def neighbours(coord: tuple, size: int) -> list:
+    """
+    :param coord: (row, col) of a cell
+    :param size: the number of rows (cols) of the grid
+    :return: the cells next to the cell (up, down, left, right)
+    """
+    a, b = coord
+    return [(a + da, b + db) for da, db in ((-1, 0), (1, 0), (0, -1), (0, 1))
+            if 0 <= a + da < size and 0 <= b + db < size]
+
+
+def partition_cages(grid: list, rnd: random.Random, max_cage: int = 4) -> list:
+    """
+    split the grid into random connected cages without repeated digits
+
+    :param grid: the solved grid
+    :param rnd: the random generator
+    :param max_cage: the largest number of cells in a cage
+    :return: list of cages, each cage is a list of (row, col)
+    """
+    size = len(grid)
+    free = set((i, j) for i in range(size) for j in range(size))
+    cages = []
+    while free:
+        start = rnd.choice(sorted(free))
+        free.discard(start)
+        cage, digits = [start], {grid[start[0]][start[1]]}
+        cage_size = rnd.randint(2, max_cage)
+        while len(cage) < cage_size:
+            options = [nb for cell in cage for nb in neighbours(cell, size)
+                       if nb in free and grid[nb[0]][nb[1]] not in digits]
+            if not options:
+                break
+            cell = rnd.choice(options)
+            free.discard(cell)
+            cage.append(cell)
+            digits.add(grid[cell[0]][cell[1]])
+        cages.append(cage)
+    return cages
+
+
+def grow_piece(start: tuple, cells: set, piece_size: int, size: int) -> list:
+    """
+    take a connected piece of cells around the start cell (breadth first)
+
+    :param start: (row, col) of the first cell
+    :param cells: the cells to take from (the piece is removed)
+    :param piece_size: the largest number of cells in the piece
+    :param size: the number of rows (cols) of the grid
+    :return: list of (row, col) of the piece
+    """
+    cells.discard(start)
+    piece = [start]
+    for cell in piece:
+        for nb in neighbours(cell, size):
+            if nb in cells and len(piece) < piece_size:
+                cells.discard(nb)
+                piece.append(nb)
+    return piece
+
+
+def split_cage(cage: list, cell: tuple, size: int) -> list:
+    """
+    split a cage in two, the half around the cell and the rest
+    (the rest may fall apart in several connected pieces)
+
+    :param cage: list of (row, col)
+    :param cell: the cell which must be in the first half
+    :param size: the number of rows (cols) of the grid
+    :return: list of the new cages
+    """
+    cells = set(cage)
+    pieces = [grow_piece(cell, cells, len(cage) // 2, size)]
+    while cells:
+        pieces.append(grow_piece(min(cells), cells, len(cage), size))
+    return pieces
+
+
+def to_json(cages: list, grid: list) -> dict:
+    """
+    :param cages: list of cages, each cage is a list of (row, col)
+    :param grid: the solved grid
+    :return: json dictionary containing sum groups (in the format of the saved json)
+    """
+    size = len(grid)
+    json_data = {'sum_groups': [{'coords': sorted(cage), 'sum': sum(grid[a][b] for a, b in cage)}
+                                for cage in cages],
+                 'known_numbers': []}
+    if size != 9:
+        json_data['size'] = size
+        json_data['box'] = list(box_shape(size))
+    return json_data
+
+
+def count_nodes(cages: list, grid: list, max_nodes: int = None) -> (int, list):
+    """
+    prove the solution is unique with the engine
+
+    :param cages: list of cages, each cage is a list of (row, col)
+    :param grid: the solved grid
+    :param max_nodes: give up after this number of search nodes (None for no limit)
+    :return: the search nodes (more than max_nodes if it gave up), and the cells where
+    a second solution differs from the grid (empty if the solution is unique)
+    """
+    engine = KillerEngine(to_json(cages, grid))
+    engine.max_nodes = max_nodes
+    solutions = engine.solve(2)
+    size = len(grid)
+    for solution in solutions:
+        diff = [(cell // size, cell % size) for cell, k in enumerate(solution)
+                if grid[cell // size][cell % size] != k]
+        if diff:
+            return engine.nodes, diff
+    return engine.nodes, []
+
+
+def make_unique(cages: list, grid: list, rnd: random.Random, max_nodes: int = SPLIT_NODES) -> int:
+    """
+    split the cages where a second solution differs until the solution is unique
+    (a grid of single cells is a solved grid), or give up when a search needs too many nodes
+
+    :param cages: list of cages (changed in place)
+    :param grid: the solved grid
+    :param rnd: the random generator
+    :param max_nodes: give up after this number of search nodes
+    :return: the search nodes of the unique puzzle (more than max_nodes if it gave up)
+    """
+    size = len(grid)
+    while True:
+        nodes, diff = count_nodes(cages, grid, max_nodes)
+        if nodes > max_nodes or not diff:
+            return nodes
+        diff = [cell for cell in diff if any(cell in cage and len(cage) > 1 for cage in cages)]
+        cell = rnd.choice(diff)
+        idx = next(i for i, cage in enumerate(cages) if cell in cage)
+        cages[idx:idx + 1] = split_cage(cages[idx], cell, size)
+
+
+def merge_cages(cages: list, grid: list, rnd: random.Random, min_nodes: int, max_nodes: int,
+                max_cage: int = 6, max_tries: int = 40) -> int:
+    """
+    merge random pairs of cages next to each other as long as the solution stays unique
+    and the puzzle is not harder than max_nodes, single cells are merged first.
+    It stops when the puzzle is hard enough and there is no single cell left
+
+    :param cages: list of cages (changed in place, the solution is already unique)
+    :param grid: the solved grid
+    :param rnd: the random generator
+    :param min_nodes: the search nodes to reach
+    :param max_nodes: the most search nodes allowed
+    :param max_cage: the largest number of cells in a merged cage
+    :param max_tries: stop after this number of failed merges
+    :return: the search nodes of the puzzle
+    """
+    size = len(grid)
+    nodes = count_nodes(cages, grid, max_nodes)[0]
+    failed = set()
+    while len(failed) < max_tries:
+        if nodes >= min_nodes and all(len(cage) > 1 for cage in cages):
+            break
+        cage_idx = {cell: i for i, cage in enumerate(cages) for cell in cage}
+        pairs = set((min(cage_idx[cell], cage_idx[nb]), max(cage_idx[cell], cage_idx[nb]))
+                    for cell in cage_idx for nb in neighbours(cell, size)
+                    if cage_idx[cell] != cage_idx[nb])
+        pairs = [(i, j) for i, j in sorted(pairs)
+                 if len(cages[i]) + len(cages[j]) <= max_cage
+                 and frozenset(cages[i] + cages[j]) not in failed
+                 and not set(grid[a][b] for a, b in cages[i]) & set(grid[a][b] for a, b in cages[j])]
+        if not pairs:
+            break
+        singles = [(i, j) for i, j in pairs if len(cages[i]) == 1 or len(cages[j]) == 1]
+        i, j = rnd.choice(singles or pairs)
+        merged = cages[:i] + cages[i + 1:j] + cages[j + 1:] + [cages[i] + cages[j]]
+        new_nodes, diff = count_nodes(merged, grid, max_nodes)
+        if diff or new_nodes > max_nodes:
+            failed.add(frozenset(merged[-1]))
+            continue
+        cages[:] = merged
+        nodes = new_nodes
+    return nodes
+
+
+def generate_one(seed: int, level: str = 'medium', size: int = 9, max_cage: int = 6) -> dict:
+    """
+    generate one killer sudoku with a unique solution (in a worker process),
+    retried with the next random grid until the difficulty is in the level
+    (ValueError after MAX_ATTEMPTS grids, the level can not be reached with this grid size)
+
+    :param seed: the random seed (the same seed gives the same puzzle)
+    :param level: the difficulty, one of LEVELS
+    :param size: the number of rows (cols) of the grid
+    :param max_cage: the largest number of cells in a cage
+    :return: json dictionary containing sum groups, the ks_info and the name of the puzzle
+    """
+    rnd = random.Random(seed)
+    min_nodes, max_nodes = LEVELS[level]
+    attempts = 0
+    while True:
+        attempts += 1
+        if attempts > MAX_ATTEMPTS:
+            raise ValueError(f'No {level} puzzle of size {size} found in {MAX_ATTEMPTS} attempts, '
+                             f'try an easier level or a larger grid')
+        grid = full_grid(rnd, size)
+        # smaller cages to start with on the larger grids, so the first search stays short
+        cages = partition_cages(grid, rnd, min(max_cage, 4, 36 // size))
+        nodes = make_unique(cages, grid, rnd)
+        if nodes > max_nodes:  # too hard for the level, or not proved unique at all
+            continue
+        nodes = merge_cages(cages, grid, rnd, min_nodes, max_nodes, max_cage)
+        if nodes >= min_nodes:
+            break
+
+    name = f'gen-{level}-{seed}'
+    json_data = {'name': name,
+                 'ks_info': {'number': name, 'difficulty': level.capitalize()}}
+    json_data.update(to_json(cages, grid))
+    json_data['nodes'] = nodes
+    json_data['attempts'] = attempts
+    return json_data
+
+
+def generate(count: int, output: str, level: str = 'medium', size: int = 9, max_cage: int = 6,
+             workers: int = None, seed: int = None) -> int:
+    """
+    generate puzzles with a process pool,
+    every puzzle is written to the output JSONL file as soon as it is finished
+
+    :param count: number of puzzles
+    :param output: path of the output JSONL file, '-' for stdout
+    :param level: the difficulty, one of LEVELS
+    :param size: the number of rows (cols) of the grid
+    :param max_cage: the largest number of cells in a cage
+    :param workers: number of worker processes (None or 0 means all cores)
+    :param seed: the first random seed (None for a random one), puzzle i uses seed + i
+    :return: number of puzzles generated
+    """
+    tic = time.time()
+    workers = workers or os.cpu_count()
+    if seed is None:
+        seed = random.randrange(1 << 31)
+    nbr_done = 0
+
+    f = sys.stdout if output == '-' else open(output, 'w')
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for i in range(count):
+                pending.add(executor.submit(generate_one, seed + i, level, size, max_cage))
+                # keep a few puzzles per worker queued
+                if len(pending) < workers * 4:
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    f.write(json.dumps(future.result()) + '\n')
+                    f.flush()
+                    nbr_done += 1
+
+            for future in as_completed(pending):
+                f.write(json.dumps(future.result()) + '\n')
+                f.flush()
+                nbr_done += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+    toc = time.time() - tic
+    print(f'Generated {nbr_done} {level} puzzles in {toc:.3f}s ({nbr_done / max(toc, 1e-9):.1f} puzzles/s)',
+          file=sys.stderr)
+    return nbr_done
+
+
+def main():
+    with open("config.json") as f:
+        configs = json.load(f)
+    gen_cfg = configs.get("generator", {})
+
+    parser = argparse.ArgumentParser(description='Generate killer sudoku puzzles with a unique solution')
+    parser.add_argument('output', help="output JSONL file, one puzzle per line ('-' for stdout)")
+    parser.add_argument('-n', '--count', type=int, default=10, help='number of puzzles')
+    parser.add_argument('-l', '--level', choices=list(LEVELS), default=gen_cfg.get("level", 'medium'),
+                        help='the difficulty of the puzzles')
+    parser.add_argument('--size', type=int, default=9, help='the grid size (4, 6, 9, 12 or 16)')
+    parser.add_argument('--max-cage', type=int, default=gen_cfg.get("max_cage", 6),
+                        help='the largest number of cells in a cage')
+    parser.add_argument('-w', '--workers', type=int, default=gen_cfg.get("workers"),
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, help='the first random seed (the same seed gives the same puzzles)')
+    args = parser.parse_args()
+
+    try:
+        generate(args.count, args.output, args.level, args.size, args.max_cage, args.workers, args.seed)
+    except ValueError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
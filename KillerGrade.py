@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from itertools import combinations
+
+from GridHelper import check_ks_data
+from KillerBatch import iter_puzzles
+from KillerEngine import BIT_COUNT, KillerEngine, cage_masks
+
+# the human techniques from the cheapest to the most expensive, and the score of every use
+TECHNIQUES = (('naked_single', 1),
+              ('hidden_single', 2),
+              ('cage_combination', 4),
+              ('rule_of_45', 8),
+              ('naked_subset', 16),
+              ('hidden_subset', 24))
+GUESS_SCORE = 100  # score of every search node when no technique is left
+
+# the grade from the most expensive technique needed
+GRADES = {'naked_single': 'Easy',
+          'hidden_single': 'Easy',
+          'cage_combination': 'Easy',
+          'rule_of_45': 'Medium',
+          'naked_subset': 'Hard',
+          'hidden_subset': 'Hard'}
+GUESS_GRADE = 'Expert'
+
+
+class KillerGrader(KillerEngine):
+    def __init__(self, json_data: dict, regions=None):
+        """
+        solve a killer sudoku like a human, always with the cheapest technique which makes progress
+        (see TECHNIQUES), the engine search finishes what is left
+
+        :param json_data: json dictionary containing sum groups and known numbers
+        :param regions: All regions in the grid (the regions in json_data or the boxes if not given)
+        """
+        super().__init__(json_data, regions)
+        n = self._size
+        self._unit_sum = n * (n + 1) // 2
+
+        # rule of 45: the cells of a unit not covered by the cages inside it (innies)
+        # and the cells outside of the cages which cover it (outies) are virtual cages
+        cage_of = {}
+        for idx, (cells, _) in enumerate(self._cages):
+            for cell in cells:
+                cage_of[cell] = idx
+        self._virtual_cages = []
+        if len(cage_of) == n * n:
+            real_cages = set(frozenset(cells) for cells, _ in self._cages)
+            for unit in self._units:
+                touching = set(cage_of[cell] for cell in unit)
+                inside = [idx for idx in touching if set(self._cages[idx][0]).issubset(unit)]
+                innies = [cell for cell in unit if cage_of[cell] not in inside]
+                outies = [cell for idx in touching for cell in self._cages[idx][0] if cell not in unit]
+                for cells, cage_sum in ((innies, self._unit_sum - sum(self._cages[idx][1] for idx in inside)),
+                                        (outies, sum(self._cages[idx][1] for idx in touching) - self._unit_sum)):
+                    if not 0 < len(cells) <= 4 or frozenset(cells) in real_cages:
+                        continue
+                    # digits can only be combined like a cage when all cells see each other
+                    if all(b in self._peers[a] for a, b in combinations(cells, 2)):
+                        self._virtual_cages.append((sorted(cells), cage_sum))
+                        real_cages.add(frozenset(cells))
+
+        self._placed = set()
+        self.steps = {name: 0 for name, _ in TECHNIQUES}
+
+    def naked_single(self, masks: list) -> bool:
+        """
+        place the cells with one candidate left and remove the digit from their peers
+
+        :param masks: candidate masks of all cells (changed in place)
+        :return: whether a cell was placed
+        """
+        progress = False
+        for cell in range(len(masks)):
+            if cell in self._placed or BIT_COUNT[masks[cell]] != 1:
+                continue
+            self._placed.add(cell)
+            progress = True
+            for peer in self._peers[cell]:
+                masks[peer] &= ~masks[cell]
+        return progress
+
+    def hidden_single(self, masks: list) -> bool:
+        """
+        a digit which fits only one cell of a unit goes there
+
+        :param masks: candidate masks of all cells (changed in place)
+        :return: whether a cell was restricted
+        """
+        progress = False
+        for unit in self._units:
+            seen_once, seen_more = 0, 0
+            for cell in unit:
+                seen_more |= seen_once & masks[cell]
+                seen_once |= masks[cell]
+            only_once = seen_once & ~seen_more
+            for cell in unit:
+                mask = masks[cell] & only_once
+                if mask and mask != masks[cell] and BIT_COUNT[mask] == 1:
+                    masks[cell] = mask
+                    progress = True
+        return progress
+
+    def prune_cages(self, masks: list, cages: list) -> bool:
+        """
+        keep only the digits of the cells which appear in a combination of the cage sum
+
+        :param masks: candidate masks of all cells (changed in place)
+        :param cages: list of (cell indexes, sum)
+        :return: whether a candidate was removed
+        """
+        progress = False
+        for cells, cage_sum in cages:
+            new_masks = cage_masks(cage_sum, tuple([masks[cell] for cell in cells]), self._size)
+            if new_masks is None:
+                raise ValueError('No solution')
+            for cell, mask in zip(cells, new_masks):
+                if mask != masks[cell]:
+                    masks[cell] = mask
+                    progress = True
+        return progress
+
+    def cage_combination(self, masks: list) -> bool:
+        return self.prune_cages(masks, self._cages)
+
+    def rule_of_45(self, masks: list) -> bool:
+        return self.prune_cages(masks, self._virtual_cages)
+
+    def naked_subset(self, masks: list) -> bool:
+        """
+        k cells of a unit with only k digits between them (pairs and triples):
+        the other cells of the unit can not have these digits
+
+        :param masks: candidate masks of all cells (changed in place)
+        :return: whether a candidate was removed
+        """
+        for unit in self._units:
+            free = [cell for cell in unit if BIT_COUNT[masks[cell]] > 1]
+            for k in (2, 3):
+                for subset in combinations([cell for cell in free if BIT_COUNT[masks[cell]] <= k], k):
+                    digits = 0
+                    for cell in subset:
+                        digits |= masks[cell]
+                    if BIT_COUNT[digits] != k:
+                        continue
+                    progress = False
+                    for cell in free:
+                        if cell not in subset and masks[cell] & digits:
+                            masks[cell] &= ~digits
+                            progress = True
+                    if progress:
+                        return True
+        return False
+
+    def hidden_subset(self, masks: list) -> bool:
+        """
+        two digits which fit only the same two cells of a unit (hidden pair):
+        these cells can not have other digits
+
+        :param masks: candidate masks of all cells (changed in place)
+        :return: whether a candidate was removed
+        """
+        for unit in self._units:
+            places = {}
+            for k in range(self._size):
+                cells = tuple(cell for cell in unit if masks[cell] >> k & 1)
+                if len(cells) == 2:
+                    places.setdefault(cells, []).append(k)
+            for cells, digits in places.items():
+                if len(digits) != 2:
+                    continue
+                pair = (1 << digits[0]) | (1 << digits[1])
+                if any(masks[cell] & ~pair for cell in cells):
+                    for cell in cells:
+                        masks[cell] &= pair
+                    return True
+        return False
+
+    def grade(self) -> dict:
+        """
+        solve with the techniques, count every technique used and the search nodes needed at the end
+
+        :return: dict of the score, the grade, the number of uses of every technique and the guesses
+        """
+        masks = [self._all_digits] * (self._size * self._size)
+        for cell, k in self._givens:
+            masks[cell] = 1 << (k - 1)
+
+        techniques = [getattr(self, name) for name, _ in TECHNIQUES]
+        while len(self._placed) < len(masks):
+            for name, technique in zip(self.steps, techniques):
+                if technique(masks):
+                    self.steps[name] += 1
+                    break
+            else:
+                break
+            if not all(masks):
+                raise ValueError('No solution')
+
+        guesses = 0
+        if len(self._placed) < len(masks):  # stuck: the engine search
+            solutions = []
+            queue = [cell for cell in range(len(masks)) if BIT_COUNT[masks[cell]] == 1]
+            if not self.propagate(masks, queue):
+                raise ValueError('No solution')
+            self.search(masks, solutions, 1)
+            if not solutions:
+                raise ValueError('No solution')
+            guesses = self.nodes - 1
+
+        used = [name for name, _ in TECHNIQUES if self.steps[name]]
+        score = sum(self.steps[name] * weight for name, weight in TECHNIQUES) + guesses * GUESS_SCORE
+        return {'score': score,
+                'grade': GUESS_GRADE if guesses else GRADES[used[-1]] if used else GRADES['naked_single'],
+                'techniques': {name: self.steps[name] for name in used},
+                'guesses': guesses,
+                'backtracks': self.backtracks}
+
+
+def grade_one(name: str, json_data: dict) -> (dict, dict):
+    """
+    grade one puzzle (in a worker process) and write the result to its ks_info,
+    the difficulty is only set if the puzzle has none
+
+    :param name: the name of the puzzle
+    :param json_data: json dictionary containing sum groups and known numbers
+    :return: the result record, and the json dict with the graded ks_info
+    """
+    tic = time.time()
+    record = {'name': name}
+    try:
+        _status, json_data = check_ks_data(json_data)
+        if not _status:
+            raise ValueError('Incomplete puzzle')
+        record.update(KillerGrader(json_data).grade())
+        ks_info = json_data.setdefault('ks_info', {'number': name})
+        ks_info.setdefault('difficulty', record['grade'])
+        ks_info.update(score=record['score'], grade=record['grade'], techniques=record['techniques'],
+                       guesses=record['guesses'])
+    except Exception as e:
+        record['error'] = str(e)
+    record['time'] = time.time() - tic
+    return record, json_data
+
+
+def batch_grade(source: str, output: str = None, workers: int = None) -> int:
+    """
+    grade all puzzles from the source with a process pool,
+    the graded puzzles are written to the output JSONL file as soon as they are finished,
+    or back to their json files when the source is a folder and there is no output
+
+    :param source: path of the folder or the JSONL file of puzzles
+    :param output: path of the output JSONL file (None to update the json files of the folder)
+    :param workers: number of worker processes (None or 0 means all cores)
+    :return: number of puzzles graded
+    """
+    tic = time.time()
+    workers = workers or os.cpu_count()
+    if output is None and not os.path.isdir(source):
+        raise ValueError('An output file is needed for a JSONL source')
+    nbr_done, nbr_graded, grades = 0, 0, {}
+
+    def write(future, f):
+        nonlocal nbr_done, nbr_graded
+        record, json_data = future.result()
+        nbr_done += 1
+        if 'error' in record:
+            print(record['name'] + ': ' + record['error'])
+            return
+        nbr_graded += 1
+        grades[record['grade']] = grades.get(record['grade'], 0) + 1
+        if f is not None:
+            f.write(json.dumps(json_data) + '\n')
+            f.flush()
+        else:
+            with open(os.path.join(source, record['name'] + '.json'), 'w') as jf:
+                json.dump(json_data, jf)
+
+    f = None if output is None else open(output, 'w')
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for name, json_data in iter_puzzles(source):
+                pending.add(executor.submit(grade_one, name, json_data))
+                # keep a few puzzles per worker queued, so a large archive is not read all at once
+                if len(pending) < workers * 4:
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future, f)
+
+            for future in as_completed(pending):
+                write(future, f)
+    finally:
+        if f is not None:
+            f.close()
+
+    toc = time.time() - tic
+    print(f'Graded {nbr_graded}/{nbr_done} puzzles in {toc:.3f}s ({nbr_done / max(toc, 1e-9):.1f} puzzles/s)')
+    for grade, count in grades.items():
+        print(f'    {grade}: {count}')
+    return nbr_graded
+
+
+def main():
+    with open("config.json") as f:
+        configs = json.load(f)
+    batch_cfg = configs.get("batch", {})
+
+    parser = argparse.ArgumentParser(description='Grade the difficulty of all killer sudoku puzzles '
+                                                 'in a folder or a JSONL file')
+    parser.add_argument('source', help='folder of saved json puzzles or a JSONL file')
+    parser.add_argument('output', nargs='?',
+                        help='output JSONL file of the graded puzzles (default: update the json files of the folder)')
+    parser.add_argument('-w', '--workers', type=int, default=batch_cfg.get("workers"),
+                        help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    batch_grade(args.source, args.output, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
 from GridHelper import *
 from KillerFiles import *
+from KillerCombos import allowed_mask, combo_list
 from KillerDown import challenge_window_json
+from KillerEngine import check_unique
+from SolveWorker import SolveWorker
+
+CHECK_NODES = 500  # the check after every change gives up after this many search nodes (the Tk thread waits)
 
 
 class KillerMaker:
@@ -30,6 +35,8 @@ class KillerMaker:
     # Window Elements
     _graph = None
     _text = None
+    _combos = None
+    _unique = None
 
     def __init__(self, _configs: dict):
         """
@@ -58,6 +65,8 @@ class KillerMaker:
                                              enable_events=True,
                                              key='_Designer_')]]),
                         sg.Column([[sg.Input(size=(5, None), disabled=True, enable_events=True, key='_Design_Text_')],
+                                   [sg.Text('', size=(12, 6), key='_Design_Combos_')],
+                                   [sg.Text('', size=(12, 2), key='_Design_Unique_')],
                                    [sg.Checkbox(self._configs["lang_dict"]["_Design_Sum_"], enable_events=True, key='_Design_Sum_')],
                                    [sg.Checkbox(self._configs["lang_dict"]["_Design_Delete_"], enable_events=True, key='_Design_Delete_')],
                                    [sg.Button(self._configs["lang_dict"]["_Design_Reset_"], key='_Design_Reset_')],
@@ -65,7 +74,8 @@ class KillerMaker:
                                    [sg.Button(self._configs["lang_dict"]["_Design_Draw_"], key='_Design_Draw_')],
                                    [sg.Button(self._configs["lang_dict"]["_Design_Open_"], key='_Design_Open_')],
                                    [sg.Button(self._configs["lang_dict"]["_Design_Challenge_"], key='_Design_Challenge_')],
-                                   [sg.Button(self._configs["lang_dict"]["_Design_Solve_"], disabled=True, key='_Design_Solve_')]],
+                                   [sg.Button(self._configs["lang_dict"]["_Design_Solve_"], disabled=True, key='_Design_Solve_')],
+                                   [sg.Button(self._configs["lang_dict"]["_Play_Cancel_"], visible=False, key='_Design_Cancel_')]],
                                   element_justification='center')
                         ]]
 
@@ -76,7 +86,7 @@ class KillerMaker:
         self._graph.erase()
 
         ksvg = KillerSVG(self._grid_parameters)
-        svg_bs, img_bs = ksvg.draw(dict(), True, self._graph_size)
+        img_bs = ksvg.render(dict()).ppm(self._graph_size)
 
         self._graph.draw_image(data=img_bs, location=(0, 0))
 
@@ -113,6 +123,8 @@ class KillerMaker:
         self._conn_list = []
 
         self._open_mode = False
+        self._combos.update(value='')
+        self._unique.update(value='')
 
     def drag_to_grp(self):
         """
@@ -156,6 +168,63 @@ class KillerMaker:
             self._cell_cages[_coord_in_grp[0]][_coord_in_grp[1]]['sum'] = _sum
         return _selected_grp
 
+    def update_combos(self):
+        """
+        show the possible combinations of the group containing the selected cell
+
+        :return: None
+        """
+        if self._cur_idx == (-1, -1):
+            self._combos.update(value='')
+            return
+        _selected_cage = self._cell_cages[self._cur_idx[0]][self._cur_idx[1]]
+        if _selected_cage['group'] == -1 or _selected_cage['sum'] == 0:
+            self._combos.update(value='')
+            return
+        _grp_size = sum(1
+                        for i in range(9)
+                        for j in range(9)
+                        if self._cell_cages[i][j]['group'] == _selected_cage['group'])
+        _combos = combo_list(_selected_cage['sum'], _grp_size)
+        if _combos:
+            self._combos.update(value='\n'.join(''.join(map(str, _combo)) for _combo in _combos))
+        else:
+            self._combos.update(value=self._configs["lang_dict"]["_Error_Cage_"])
+
+    def current_sum_groups(self) -> list:
+        """
+        the sum groups of the current design (or of the opened puzzle)
+
+        :return: list containing all sum groups
+        """
+        if self._open_mode:
+            return self._json_data['sum_groups']
+        return create_sum_group(self._cell_cages)
+
+    def update_unique(self):
+        """
+        check whether the current design (once all cells have a group and a sum)
+        has a unique solution and show the result
+
+        :return: None
+        """
+        _sum_groups = self.current_sum_groups()
+        _size = grid_shape(self._json_data)[0]
+        if (sum(len(sum_group['coords']) for sum_group in _sum_groups) != _size * _size
+                or sum(sum_group['sum'] for sum_group in _sum_groups) != _size * _size * (_size + 1) // 2):
+            self._unique.update(value='')
+            return
+        _unique, _solns = check_unique(dict(self._json_data, sum_groups=_sum_groups, known_numbers=[]),
+                                       max_nodes=CHECK_NODES)
+        if _unique is None:  # too hard to check here, the Solve button checks it in the background
+            self._unique.update(value=self._configs["lang_dict"]["_Unique_Unknown_"])
+        elif _unique:
+            self._unique.update(value=self._configs["lang_dict"]["_Unique_Unique_"])
+        elif _solns:
+            self._unique.update(value=self._configs["lang_dict"]["_Unique_Multiple_"])
+        else:
+            self._unique.update(value=self._configs["lang_dict"]["_Unique_None_"])
+
     def sum_mode_text_update(self, _input: str):
         """
         update the input sum in the graph and the DataFrame for the sum mode
@@ -183,6 +252,8 @@ class KillerMaker:
                                                                    color='red',
                                                                    font=('sans-serif', 16),
                                                                    text_location=sg.TEXT_LOCATION_TOP_LEFT)
+        self.update_combos()
+        self.update_unique()
 
     def sum_mode_mouse_up(self):
         """
@@ -211,6 +282,7 @@ class KillerMaker:
                 self._text.update(value='')
             else:
                 self._text.update(value=str(_cur_selection_sum))
+        self.update_combos()
 
     def delete_mode_mouse_up(self):
         """
@@ -237,6 +309,7 @@ class KillerMaker:
         for _pt in _cur_del_pt_idx:
             self._cell_cages[_pt[0]][_pt[1]] = {'group': -1,
                                                 'sum': 0}
+        self.update_unique()
 
     def init_window(self):
         """
@@ -252,6 +325,10 @@ class KillerMaker:
         _draw_button = window.Element('_Design_Draw_')
         _solve_button = window.Element('_Design_Solve_')
         self._text = window.Element('_Design_Text_')
+        self._combos = window.Element('_Design_Combos_')
+        self._unique = window.Element('_Design_Unique_')
+        _cancel_button = window.Element('_Design_Cancel_')
+        _checker = SolveWorker(window, '_Design_Checked_')
 
         # if self._grid_parameters['grid_label']:
         #     _grid_svg = "./grid.svg"
@@ -264,13 +341,17 @@ class KillerMaker:
         # self._graph.draw_image(data=_bs, location=(0, 0))
 
         ksvg = KillerSVG(self._grid_parameters)
-        svg_bs, img_bs = ksvg.draw(dict(), True, self._graph_size)
+        img_bs = ksvg.render(dict()).ppm(self._graph_size)
 
         self._graph.draw_image(data=img_bs, location=(0, 0))
 
         while True:
-            event, values = window.read()
+            event, values = window.read(timeout=100 if _checker.running else None)
+            if _checker.running:
+                self._unique.update(value=self._configs["lang_dict"]["_Play_Solving_"] + ' ' +
+                                    '{:.1f}s'.format(_checker.elapsed))
             if event in (sg.WIN_CLOSED, 'Exit'):
+                _checker.cancel()
                 break
 
             elif event == '_Designer_':
@@ -309,6 +390,7 @@ class KillerMaker:
                     if not self._dragging:
                         continue
                     self.drag_to_grp()
+                    self.update_unique()
                     self._dragging = False
                     self._cur_pt = (-1, -1)
 
@@ -322,6 +404,7 @@ class KillerMaker:
                 self._cur_pt = (-1, -1)
                 self._graph.delete_figure(self._cur_selection_circle)
                 self._cur_selection_circle = None
+                self._combos.update(value='')
 
             elif event == '_Design_Delete_':
                 self._delete_mode = values["_Design_Delete_"]
@@ -349,6 +432,11 @@ class KillerMaker:
                 if not self._open_mode:
                     self._json_data['sum_groups'] = create_sum_group(self._cell_cages)
                     self._json_data['known_numbers'] = []
+                _size = grid_shape(self._json_data)[0]
+                if any(not allowed_mask(sum_group['sum'], len(sum_group['coords']), 0, _size)
+                       for sum_group in self._json_data['sum_groups']):
+                    sg.popup_error(self._configs["lang_dict"]["_Error_Cage_"])
+                    continue
                 try:
                     draw_file(self._grid_parameters, self._json_data, self._graph_size, self._graph, _title)
                     _sum_check.update(value=False)
@@ -379,6 +467,7 @@ class KillerMaker:
                 self._text.update(value='', disabled=True)
                 self._open_mode = True
                 self._sum_mode = False
+                self.update_unique()
 
             elif event == '_Design_Challenge_':
                 _json_data = challenge_window_json(self._configs)
@@ -393,11 +482,51 @@ class KillerMaker:
                 self._text.update(value='', disabled=True)
                 self._open_mode = True
                 self._sum_mode = False
+                self.update_unique()
                 # challenge_window_image(self._graph, _title, self._graph_size)
 
-            elif event == '_Design_Solve_':  # go to solver
+            elif event == '_Design_Solve_':  # check the solution is unique, then go to solver
+                if _checker.running:
+                    continue
+                _checker.start(check_unique, (self._json_data,),
+                               self._configs["solver"].get("time_limit"))
+                _solve_button.update(disabled=True)
+                _cancel_button.update(visible=True)
+
+            elif event == '_Design_Cancel_':
+                _checker.cancel()
+
+            elif event == '_Design_Checked_':
                 from KillerPlayer import KillerPlayer
 
+                _solve_button.update(disabled=False)
+                _cancel_button.update(visible=False)
+                self._unique.update(value='')
+                _status, _result = values[event]
+                if _status == 'cancelled':
+                    continue
+                if _status == 'ok':
+                    _unique, _solns = _result
+                else:
+                    _unique, _solns = False, []
+                if not _unique:
+                    if len(_solns) == 2:
+                        _diff = [chr(65 + a['coord'][0]) + str(a['coord'][1] + 1) + ': ' +
+                                 str(a['possible_numbers'][0]) + '/' + str(b['possible_numbers'][0])
+                                 for a, b in zip(*_solns) if a != b]
+                        _msg = self._configs["lang_dict"]["_Unique_Multiple_"] + '\n' + ', '.join(_diff)
+                    elif _status == 'timeout':
+                        _msg = self._configs["lang_dict"]["_Error_Timeout_"]
+                    elif _status == 'error':  # the check failed, it says nothing about the puzzle
+                        print(_result)
+                        _msg = self._configs["lang_dict"]["_Error_Solver_"] + '\n' + str(_result)
+                    elif _unique is None:
+                        _msg = self._configs["lang_dict"]["_Unique_Unknown_"]
+                    else:
+                        _msg = self._configs["lang_dict"]["_Unique_None_"]
+                    if sg.popup_ok_cancel(_msg) != 'OK':
+                        continue
+
                 window.close()
                 kp = KillerPlayer(self._configs, self._json_data)
                 kp.init_window()
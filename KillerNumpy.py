@@ -0,0 +1,278 @@
+import argparse
+import json
+import time
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('KillerNumpy needs numpy (pip install numpy), the other scripts work without it')
+
+from GridHelper import check_ks_data, grid_shape, regions_key
+from KillerBatch import iter_puzzles
+from KillerCombos import combo_table
+from KillerEngine import unit_tables
+
+BIT_COUNT = np.array([bin(_m).count('1') for _m in range(1 << 16)], dtype=np.uint8)
+
+
+def or_reduce(array: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    bitwise or over the last axis (a few elements), one vector operation per element
+
+    :param array: the masks
+    :return: the bits seen at least once, and the bits seen more than once
+    """
+    seen_once = array[..., 0].copy()
+    seen_more = np.zeros_like(seen_once)
+    for i in range(1, array.shape[-1]):
+        seen_more |= seen_once & array[..., i]
+        seen_once |= array[..., i]
+    return seen_once, seen_more
+
+
+@lru_cache(maxsize=None)
+def combo_array(max_digit: int, size: int) -> np.ndarray:
+    """
+    every combination of a cage size as an array, padded with 0 (no combination)
+
+    :param max_digit: the largest digit (the size of the grid)
+    :param size: the number of cells in the cage
+    :return: array of (sum, combination index) -> combination mask
+    """
+    table = combo_table(max_digit)
+    max_sum = max_digit * (max_digit + 1) // 2
+    combos = [table.get((cage_sum, size), []) for cage_sum in range(max_sum + 1)]
+    array = np.zeros((max_sum + 1, max(len(c) for c in combos)), dtype=np.uint16)
+    for cage_sum, masks in enumerate(combos):
+        array[cage_sum, :len(masks)] = masks
+    return array
+
+
+@lru_cache(maxsize=32)
+def unit_arrays(size: int = 9, regions: tuple = None, box: tuple = None) -> (np.ndarray, np.ndarray):
+    """
+    the units of a grid layout as index arrays (see KillerEngine.unit_tables)
+
+    :param size: the number of rows (cols) of the grid
+    :param regions: All regions in the grid (as tuples), None for the boxes
+    :param box: (rows, cols) of a box
+    :return: (3 * size, size) array of the cells of every unit, and (size * size, 3) array
+    of the positions (unit * size + index in the unit) of every cell in its units
+    """
+    units, _ = unit_tables(size, regions, box)
+    units = np.array(units, dtype=np.intp)
+    cell_pos = [[] for _ in range(size * size)]
+    for pos, cell in enumerate(units.ravel()):
+        cell_pos[cell].append(pos)
+    return units, np.array(cell_pos, dtype=np.intp)
+
+
+class CandidateBatch:
+    def __init__(self, puzzles: list, regions=None):
+        """
+        the candidates of many puzzles of the same grid size as one (N, size, size) uint16 array,
+        bit k - 1 of a cell means digit k is possible
+
+        :param puzzles: list of json dictionaries containing sum groups and known numbers
+        :param regions: All regions in the grid (the regions in every json or the boxes if not given)
+        """
+        n, _ = grid_shape(puzzles[0])
+        self._size = n
+        self._all_digits = (1 << n) - 1
+        nbr = len(puzzles)
+
+        self.masks = np.full((nbr, n, n), self._all_digits, dtype=np.uint16)
+        self.broken = np.zeros(nbr, dtype=bool)  # puzzles with a contradiction
+
+        units, cell_pos = [], []
+        cages = {}  # cage size -> (puzzle indexes, cells, sums)
+        for idx, json_data in enumerate(puzzles):
+            size, box = grid_shape(json_data)
+            if size != n:
+                raise ValueError("All puzzles of a batch must have the same grid size")
+            _regions = regions if regions is not None else json_data.get('regions')
+            _units, _cell_pos = unit_arrays(n, regions_key(_regions), box)
+            units.append(_units)
+            cell_pos.append(_cell_pos)
+
+            for known_number in json_data.get('known_numbers', []):
+                if not known_number['small']:
+                    a, b = known_number['coord']
+                    self.masks[idx, a, b] = 1 << (known_number['possible_numbers'][0] - 1)
+            for sum_group in json_data.get('sum_groups', []):
+                _cage = cages.setdefault(len(sum_group['coords']), ([], [], []))
+                _cage[0].append(idx)
+                _cage[1].append([a * n + b for a, b in sum_group['coords']])
+                _cage[2].append(sum_group['sum'])
+
+        self._units = np.stack(units)  # (N, 3n, n)
+        self._cell_pos = np.stack(cell_pos)  # (N, n * n, 3)
+        self._cages = [(np.array(idx, dtype=np.intp)[:, None], np.array(cells, dtype=np.intp),
+                        combo_array(n, cage_size)[np.array(sums, dtype=np.intp)])
+                       for cage_size, (idx, cells, sums) in sorted(cages.items())]
+
+    def eliminate_singles(self, flat: np.ndarray, active: np.ndarray):
+        """
+        remove the digits of the solved cells from the other cells of their units
+
+        :param flat: (M, size * size) candidate masks of the active puzzles (changed in place)
+        :param active: (M,) indexes of the active puzzles in the batch
+        """
+        rows = np.arange(len(active))[:, None, None]
+        single = BIT_COUNT[flat] == 1
+        solved = np.where(single, flat, 0)[rows, self._units[active]]  # (M, 3n, n)
+        solved_or, twice = or_reduce(solved)
+        self.broken[active] |= (twice != 0).any(axis=1)  # the same digit solved twice in a unit
+
+        removed, _ = or_reduce(solved_or[rows, self._cell_pos[active] // self._size])
+        flat[:] = np.where(single, flat, flat & ~removed)
+
+    def hidden_singles(self, flat: np.ndarray, active: np.ndarray):
+        """
+        a digit which fits only one cell of a unit goes there
+
+        :param flat: (M, size * size) candidate masks of the active puzzles (changed in place)
+        :param active: (M,) indexes of the active puzzles in the batch
+        """
+        rows = np.arange(len(active))[:, None, None]
+        unit_masks = flat[rows, self._units[active]]  # (M, 3n, n)
+        seen_once, seen_more = or_reduce(unit_masks)
+        self.broken[active] |= (seen_once != self._all_digits).any(axis=1)  # a digit which fits no cell
+        only_once = seen_once & ~seen_more
+
+        hidden = (unit_masks & only_once[..., None]).reshape(len(flat), -1)
+        hidden, _ = or_reduce(hidden[rows, self._cell_pos[active]])  # (M, n * n)
+        self.broken[active] |= (BIT_COUNT[hidden] > 1).any(axis=1)
+        flat[:] = np.where(hidden != 0, hidden, flat)
+
+    def prune_cages(self, flat: np.ndarray, local: np.ndarray):
+        """
+        keep only the digits of the cage cells which appear in a combination of the cage sum
+        that fits the candidates of the cage
+
+        :param flat: (M, size * size) candidate masks of the active puzzles (changed in place)
+        :param local: (N,) the row of every puzzle in flat, -1 if it is not active
+        """
+        for idx, cells, combos in self._cages:
+            rows = local[idx]
+            keep = rows[:, 0] >= 0
+            rows, cells, combos = rows[keep], cells[keep], combos[keep]
+            cell_masks = flat[rows, cells]  # (K, cage size)
+            single = BIT_COUNT[cell_masks] == 1  # the digits can not repeat in a cage
+            solved_or, _ = or_reduce(np.where(single, cell_masks, 0))
+            cell_masks = np.where(single, cell_masks, cell_masks & ~solved_or[:, None])
+            cage_or, _ = or_reduce(cell_masks)
+            fits = (combos != 0) & (combos & ~cage_or[:, None] == 0)
+            for i in range(cell_masks.shape[1]):
+                fits &= (cell_masks[:, i, None] & combos) != 0
+            allowed, _ = or_reduce(np.where(fits, combos, 0))
+            flat[rows, cells] = cell_masks & allowed[:, None]
+
+    def propagate(self, max_rounds: int = 100) -> int:
+        """
+        eliminate the singles, fill the hidden singles and prune the cages of all puzzles at once,
+        until nothing changes (the puzzles which stopped changing are left out of the next rounds)
+
+        :param max_rounds: the most rounds
+        :return: the number of rounds
+        """
+        nbr = len(self.masks)
+        masks = self.masks.reshape(nbr, -1)
+        active = np.flatnonzero(~self.broken)
+        local = np.full(nbr, -1, dtype=np.intp)
+        rounds = 0
+        while active.size and rounds < max_rounds:
+            rounds += 1
+            local[:] = -1
+            local[active] = np.arange(len(active))
+            flat = masks[active]
+            before = flat.copy()
+            self.eliminate_singles(flat, active)
+            self.hidden_singles(flat, active)
+            self.prune_cages(flat, local)
+            self.broken[active] |= (flat == 0).any(axis=1)
+            masks[active] = flat
+            active = active[(flat != before).any(axis=1) & ~self.broken[active]]
+        return rounds
+
+    def solved(self) -> np.ndarray:
+        """
+        :return: (N,) bool array of the puzzles solved by propagation alone
+        """
+        return (BIT_COUNT[self.masks] == 1).all(axis=(1, 2)) & ~self.broken
+
+    def known_numbers(self, idx: int) -> list:
+        """
+        the candidates of one puzzle as known numbers, solved cells are large numbers,
+        the other cells small numbers (the notes of the player)
+
+        :param idx: the index of the puzzle in the batch
+        :return: list of known numbers
+        """
+        known_nbrs = []
+        for (a, b), mask in np.ndenumerate(self.masks[idx]):
+            digits = [k + 1 for k in range(self._size) if int(mask) >> k & 1]
+            known_nbrs.append({'coord': (a, b), 'small': len(digits) != 1, 'possible_numbers': digits})
+        return known_nbrs
+
+
+def batch_presolve(source: str, output: str = None, batch_size: int = 4096) -> int:
+    """
+    propagate all puzzles from the source in batches of the same grid size
+
+    :param source: path of the folder or the JSONL file of puzzles
+    :param output: path of the output JSONL file (None for no output),
+    every puzzle with its candidates as known numbers (see CandidateBatch.known_numbers)
+    :param batch_size: the most puzzles in a batch
+    :return: number of puzzles solved by propagation alone
+    """
+    tic = time.time()
+    batches = {}
+    for name, json_data in iter_puzzles(source):
+        _status, json_data = check_ks_data(json_data)
+        if _status:
+            batches.setdefault(grid_shape(json_data)[0], []).append((name, json_data))
+
+    nbr_done, nbr_solved = 0, 0
+    f = None if output is None else open(output, 'w')
+    try:
+        for puzzles in batches.values():
+            for start in range(0, len(puzzles), batch_size):
+                names, jsons = zip(*puzzles[start:start + batch_size])
+                batch = CandidateBatch(list(jsons))
+                batch.propagate()
+                solved = batch.solved()
+                nbr_done += len(names)
+                nbr_solved += int(solved.sum())
+                if f is None:
+                    continue
+                for idx, name in enumerate(names):
+                    json_data = dict(jsons[idx], name=name, solved=bool(solved[idx]),
+                                     broken=bool(batch.broken[idx]),
+                                     known_numbers=[dict(known_nbr, coord=list(known_nbr['coord']))
+                                                    for known_nbr in batch.known_numbers(idx)])
+                    f.write(json.dumps(json_data) + '\n')
+    finally:
+        if f is not None:
+            f.close()
+
+    toc = time.time() - tic
+    print(f'Solved {nbr_solved}/{nbr_done} puzzles by propagation in {toc:.3f}s '
+          f'({nbr_done / max(toc, 1e-9):.1f} puzzles/s)')
+    return nbr_solved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Propagate the candidates of all puzzles in a folder or a JSONL file '
+                                                 'with numpy')
+    parser.add_argument('source', help='folder of saved json puzzles or a JSONL file')
+    parser.add_argument('output', nargs='?', help='output JSONL file of the puzzles with their candidates')
+    parser.add_argument('-b', '--batch-size', type=int, default=4096, help='the most puzzles in a batch')
+    args = parser.parse_args()
+
+    batch_presolve(args.source, args.output, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
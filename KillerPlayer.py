@@ -1,6 +1,8 @@
 from GridHelper import *
 from KillerFiles import *
+from KillerCombos import combo_list, digits_mask
 from KillerDown import challenge_window_json
+from SolveWorker import SolveWorker
 from SudokuSolve import sudoku_solve
 
 
@@ -19,6 +21,7 @@ class KillerPlayer:
                       'key': None}
                      for _ in range(9)]
                     for _ in range(9)]
+    _image_numbers = {}  # (row, col) -> (small, possible numbers) of the numbers drawn in the puzzle image
 
     _input_mode = False
     _comment_matrix = [[{'comment': None,
@@ -30,6 +33,8 @@ class KillerPlayer:
     _graph = None
     _title = None
     _timer = None
+    _combos = None
+    _window = None
 
     def __init__(self, _configs: dict, _json_data = None):
         """
@@ -40,13 +45,9 @@ class KillerPlayer:
         :param _json_data: json dictionary containing sum groups and known numbers
         """
         self._configs = _configs
-        self._grid_parameters = calc_size(_configs["grid_parameters"])
-
         self._graph_size = _configs["graph_size"]
-
-        self._graph_scale = self._graph_size / self._grid_parameters['size']
-        self._graph_cell_size = self._grid_parameters['cell_size'] * self._graph_scale
-        self._graph_boarders = [i * self._graph_scale for i in self._grid_parameters['boarders']]
+        self._grid_parameters = _configs["grid_parameters"]
+        self.set_shape(9, (3, 3))
 
         self.layout = [[sg.Column([[sg.Graph((self._graph_size, int(self._graph_size * 0.04)),
                                              (0, int(self._graph_size * 0.04)),
@@ -60,14 +61,11 @@ class KillerPlayer:
                                              key='_Player_')]]),
                         sg.Column([[sg.Button(str(i),
                                               size=(4, 2),
-                                              key='_Play_' + str(i) + '_') for i in range(1, 4)],
-                                   [sg.Button(str(i),
-                                              size=(4, 2),
-                                              key='_Play_' + str(i) + '_') for i in range(4, 7)],
-                                   [sg.Button(str(i),
-                                              size=(4, 2),
-                                              key='_Play_' + str(i) + '_') for i in range(7, 10)],
-                                   [sg.Text('00:00:00', key='_Play_Timer_')],
+                                              visible=i <= 9,  # 10-16 only for the larger grids
+                                              key='_Play_' + str(i) + '_') for i in range(j, min(j + 3, MAX_SIZE + 1))]
+                                   for j in range(1, MAX_SIZE + 1, 3)] +
+                                  [[sg.Text('00:00:00', key='_Play_Timer_')],
+                                   [sg.Text('', size=(12, 6), key='_Play_Combos_')],
                                    [sg.Checkbox(self._configs["lang_dict"]["_Play_Small_"], enable_events=True, key='_Play_Small_')],
                                    [sg.Checkbox(self._configs["lang_dict"]["_Play_Comment_"], enable_events=True, key='_Play_Comment_')],
                                    [sg.Input(size=(8, None),
@@ -79,19 +77,66 @@ class KillerPlayer:
                                    [sg.Button(self._configs["lang_dict"]["_Play_Challenge_"], key='_Play_Challenge_')],
                                    [sg.Button(self._configs["lang_dict"]["_Play_Save_"], key='_Play_Save_')],
                                    [sg.Button(self._configs["lang_dict"]["_Play_Solve_"], key='_Play_Solve_')],
+                                   [sg.Text('', size=(12, None), key='_Play_Solving_')],
+                                   [sg.Button(self._configs["lang_dict"]["_Play_Cancel_"], visible=False, key='_Play_Cancel_')],
                                    [sg.Button(self._configs["lang_dict"]["_Play_Design_"], key='_Play_Design_')]
                                    ], element_justification='center')
                         ]]
 
         self._button_keys = {}
-        for i in range(1, 10):
+        for i in range(1, MAX_SIZE + 1):
             self._button_keys['_Play_' + str(i) + '_'] = i
 
-        self._keypress_lst = list(map(str, range(1, 10)))
+        # number keys 1-9, then letters A-G (either case) for 10-16 on the larger grids
+        self._keypress_nbrs = {str(i): i for i in range(1, 10)}
+        for i, _letter in enumerate('ABCDEFG'[:MAX_SIZE - 9]):
+            self._keypress_nbrs[_letter] = self._keypress_nbrs[_letter.lower()] = 10 + i
 
         if _json_data is not None:
             self._json_data = _json_data
 
+    def set_shape(self, grid_size: int, box: tuple):
+        """
+        calculate the grid for the size and the box shape of the puzzle
+
+        :param grid_size: the number of rows (cols) of the grid
+        :param box: (rows, cols) of a box
+        """
+        self._grid_size = grid_size
+        self._grid_parameters = calc_size(self._grid_parameters, grid_size, box)
+
+        self._graph_scale = self._graph_size / self._grid_parameters['size']
+        self._graph_cell_size = self._grid_parameters['cell_size'] * self._graph_scale
+        self._graph_boarders = [i * self._graph_scale for i in self._grid_parameters['boarders']]
+        self._graph_y_boarders = [i * self._graph_scale for i in self._grid_parameters['y_boarders']]
+        self._font_scale = 9 / grid_size
+
+        self._text_matrix = [[{'small': None,
+                               'possible_numbers': [],
+                               'key': None}
+                              for _ in range(grid_size)]
+                             for _ in range(grid_size)]
+        self._comment_matrix = [[{'comment': None,
+                                  'key': None}
+                                 for _ in range(grid_size)]
+                                for _ in range(grid_size)]
+
+    def update_shape(self):
+        """
+        change the grid (and the number buttons) if the loaded puzzle has another size or box shape,
+        all numbers and comments in the grid are removed
+
+        :return: whether the grid changed
+        """
+        _grid_size, _box = grid_shape(self._json_data or {})[0], line_box(self._json_data or {})
+        if (_grid_size, _box) == (self._grid_size, self._grid_parameters['box']):
+            return False
+        self.reset_all()
+        self.set_shape(_grid_size, _box)
+        for i in range(1, MAX_SIZE + 1):
+            self._window['_Play_' + str(i) + '_'].update(visible=i <= _grid_size)
+        return True
+
     def clear_player(self):
         """
         reset the graph to the default one
@@ -106,9 +151,18 @@ class KillerPlayer:
         #                        scale=self._graph_scale)
 
         ksvg = KillerSVG(self._grid_parameters)
-        svg_bs, img_bs = ksvg.draw(dict(), True, self._graph_size)
+        img_bs = ksvg.render(dict()).ppm(self._graph_size)
 
         self._graph.draw_image(data=img_bs, location=(0, 0))
+        self._image_numbers = {}
+
+    def draw_puzzle(self):
+        """
+        draw the puzzle image (the cages and the known numbers of _json_data)
+        """
+        draw_file(self._grid_parameters, self._json_data, self._graph_size, self._graph, self._title)
+        self._image_numbers = {tuple(_cell['coord']): (_cell['small'], list(_cell['possible_numbers']))
+                               for _cell in self._json_data.get('known_numbers', [])}
 
     def reset_all(self):
         """
@@ -119,8 +173,8 @@ class KillerPlayer:
         self._cur_selection_circle = None
         self._cur_idx = (-1, -1)
 
-        for i in range(9):
-            for j in range(9):
+        for i in range(self._grid_size):
+            for j in range(self._grid_size):
                 if self._text_matrix[i][j]['key'] is not None:
                     self._graph.delete_figure(self._text_matrix[i][j]['key'])
                 self._text_matrix[i][j] = {'small': None,
@@ -133,6 +187,7 @@ class KillerPlayer:
 
         self._timer_start = False
         self._timer.update("00:00:00")
+        self._combos.update(value='')
 
     def write_comment(self, _comment: str):
         """
@@ -159,6 +214,51 @@ class KillerPlayer:
             self._comment_matrix[self._cur_idx[0]][self._cur_idx[1]] = {'comment': _comment,
                                                                         'key': _new_key}
 
+    def draw_cell(self, _idx: tuple, _small: bool, _nbrs: list):
+        """
+        draw the numbers of a cell on the graph, small numbers on the left of the cell, a big number in the center
+
+        :param _idx: (row, col) of the cell
+        :param _small: whether the numbers are small
+        :param _nbrs: the numbers in the cell
+        :return: the key of the text figure
+        """
+        _center = calc_center_coord(_idx, self._graph_boarders, self._graph_cell_size, self._graph_y_boarders)
+        if _small:
+            _small_nbrs_pos = (_center[0] - self._graph_cell_size * 0.4,
+                               _center[1] + self._graph_cell_size * 0.3)
+            return self._graph.draw_text(''.join(map(str, _nbrs)),
+                                         _small_nbrs_pos,
+                                         font=('sans-serif', max(int(8 * self._font_scale), 5)),
+                                         text_location=sg.TEXT_LOCATION_LEFT)
+        return self._graph.draw_text(str(_nbrs[0]),
+                                     _center,
+                                     font=('sans-serif', int(24 * self._font_scale)),
+                                     text_location=sg.TEXT_LOCATION_CENTER)
+
+    def set_numbers(self, _known_numbers: list):
+        """
+        show exactly the given numbers in the grid, only the cells which changed are erased and drawn
+        (the numbers already in the puzzle image are not drawn again)
+
+        :param _known_numbers: list of known numbers (see KillerSVG.draw_known_number)
+        """
+        _target = {tuple(_cell['coord']): (_cell['small'], list(_cell['possible_numbers']))
+                   for _cell in _known_numbers}
+        for i in range(self._grid_size):
+            for j in range(self._grid_size):
+                _small, _nbrs = _target.get((i, j), (None, []))
+                if self._image_numbers.get((i, j)) == (_small, _nbrs):
+                    _small, _nbrs = None, []
+                _cell = self._text_matrix[i][j]
+                if (_cell['small'], _cell['possible_numbers']) == (_small, _nbrs):
+                    continue
+                if _cell['key'] is not None:
+                    self._graph.delete_figure(_cell['key'])
+                self._text_matrix[i][j] = {'small': _small,
+                                           'possible_numbers': _nbrs,
+                                           'key': None if _small is None else self.draw_cell((i, j), _small, _nbrs)}
+
     def write_nbr(self, _selected_nbr: int, _cur_small_mode: bool):
         """
         Write the selected numbers on the graph, maybe large or small
@@ -168,7 +268,7 @@ class KillerPlayer:
         :param _cur_small_mode: The current small/large mode for the written numbers
         :return: None
         """
-        if self._cur_idx == (-1, -1):  # if no selected cell
+        if self._cur_idx == (-1, -1) or _selected_nbr > self._grid_size:  # if no selected cell
             return
         if not self._timer_start:  # start the timer if not
             self._timer_start = time.time()
@@ -193,17 +293,11 @@ class KillerPlayer:
                 # otherwise, write the new small number in the cell
                 _cur_nbrs.append(_selected_nbr)
                 _cur_nbrs.sort()
-            _small_nbrs_pos = (self._cur_pt_center[0] - self._graph_cell_size * 0.4,
-                               self._cur_pt_center[1] + self._graph_cell_size * 0.3)
             # write all small numbers in the cell
-            _nbrs_str = ''.join(map(str, _cur_nbrs))
             self._text_matrix[self._cur_idx[0]][self._cur_idx[1]] = {'small': True,
                                                                      'possible_numbers': _cur_nbrs,
-                                                                     'key': self._graph.draw_text(
-                                                                         _nbrs_str,
-                                                                         _small_nbrs_pos,
-                                                                         font=('sans-serif', 8),
-                                                                         text_location=sg.TEXT_LOCATION_LEFT)}
+                                                                     'key': self.draw_cell(self._cur_idx, True,
+                                                                                           _cur_nbrs)}
         else:  # big number mode
             if _exists_small is not None and not _exists_small:  # if the current cell has big number
                 # remove the old number from the df and the graph
@@ -219,11 +313,34 @@ class KillerPlayer:
             # write the new big number in the cell
             self._text_matrix[self._cur_idx[0]][self._cur_idx[1]] = {'small': False,
                                                                      'possible_numbers': [_selected_nbr],
-                                                                     'key': self._graph.draw_text(
-                                                                         str(_selected_nbr),
-                                                                         self._cur_pt_center,
-                                                                         font=('sans-serif', 24),
-                                                                         text_location=sg.TEXT_LOCATION_CENTER)}
+                                                                     'key': self.draw_cell(self._cur_idx, False,
+                                                                                           [_selected_nbr])}
+
+    def update_combos(self):
+        """
+        show the possible combinations of the cage containing the selected cell,
+        the big numbers already in the cage are taken out of the combinations
+
+        :return: None
+        """
+        if self._cur_idx == (-1, -1) or self._json_data is None or 'sum_groups' not in self._json_data:
+            self._combos.update(value='')
+            return
+        for sum_group in self._json_data['sum_groups']:
+            if tuple(self._cur_idx) not in [tuple(coord) for coord in sum_group['coords']]:
+                continue
+            _remaining = sum_group['sum']
+            _used = []
+            for a, b in sum_group['coords']:
+                _exists_small = self._text_matrix[a][b]['small']
+                if _exists_small is not None and not _exists_small:
+                    _used.append(self._text_matrix[a][b]['possible_numbers'][0])
+                    _remaining -= _used[-1]
+            _combos = combo_list(_remaining, len(sum_group['coords']) - len(_used), digits_mask(_used),
+                                 self._grid_size)
+            self._combos.update(value='\n'.join(''.join(map(str, _combo)) for _combo in _combos))
+            return
+        self._combos.update(value='')
 
     def open_from_file(self):
         """
@@ -258,18 +375,17 @@ class KillerPlayer:
 
             if event == '_Open_Open_':
                 if _status:
-                    draw_file(self._grid_parameters, self._json_data, self._graph_size, self._graph, self._title)
+                    self.update_shape()
+                    self.draw_puzzle()
                     self.reset_all()
 
             elif event == '_Open_Load_':
-                for _cell in self._json_data['known_numbers']:
-                    self._cur_idx = _cell['coord']
-                    self._cur_pt_center = calc_center_coord(self._cur_idx, self._graph_boarders, self._graph_cell_size)
-                    if not _cell['small']:
-                        self.write_nbr(_cell['possible_numbers'][0], False)
-                    else:
-                        for _nbr in _cell['possible_numbers']:
-                            self.write_nbr(_nbr, True)
+                if self.update_shape():
+                    self.draw_puzzle()
+                # the saved progress in one pass, only the changed cells are drawn
+                self.set_numbers(self._json_data['known_numbers'])
+                if self._json_data['known_numbers'] and not self._timer_start:
+                    self._timer_start = time.time()
 
             _open_window.close()
 
@@ -283,13 +399,20 @@ class KillerPlayer:
                            return_keyboard_events=True)
         window.Finalize()
 
+        self._window = window
         self._title = window.Element('_Play_Title_')
         self._graph = window.Element('_Player_')
         self._timer = window.Element('_Play_Timer_')
+        self._combos = window.Element('_Play_Combos_')
         _input = window.Element('_Play_Input_')
+        _solve_button = window.Element('_Play_Solve_')
+        _cancel_button = window.Element('_Play_Cancel_')
+        _solving_text = window.Element('_Play_Solving_')
+        _solver = SolveWorker(window, '_Play_Solved_')
 
         if self._json_data is not None:
-            draw_file(self._grid_parameters, self._json_data, self._graph_size, self._graph, self._title)
+            self.update_shape()
+            self.draw_puzzle()
         else:
             self.clear_player()
 
@@ -298,21 +421,29 @@ class KillerPlayer:
             if self._timer_start:
                 self._timer.update(time.strftime("%H:%M:%S",
                                                  time.gmtime(time.time() - self._timer_start)))
+            if _solver.running:
+                _solving_text.update(value=self._configs["lang_dict"]["_Play_Solving_"] + ' ' +
+                                     '{:.1f}s'.format(_solver.elapsed))
 
             if event in (sg.WIN_CLOSED, 'Exit'):
+                _solver.cancel()
                 break
 
             elif event == '_Player_':  # MOUSE_UP FINISHED
                 self._graph.delete_figure(self._cur_selection_circle)
 
                 x, y = values["_Player_"]
-                self._cur_idx = select_idx(x, y, self._graph_boarders)
-                self._cur_pt_center = calc_center_coord(self._cur_idx, self._graph_boarders, self._graph_cell_size)
+                self._cur_idx = select_idx(x, y, self._graph_boarders, self._graph_y_boarders)
+                if self._cur_idx == (-1, -1):  # outside the grid
+                    continue
+                self._cur_pt_center = calc_center_coord(self._cur_idx, self._graph_boarders, self._graph_cell_size,
+                                                        self._graph_y_boarders)
                 self._cur_selection_circle = self._graph.draw_circle(self._cur_pt_center,
                                                                      self._graph_cell_size / 2,
                                                                      fill_color='#ffcccc',
                                                                      line_width=0)
                 self._graph.send_figure_to_back(self._cur_selection_circle)
+                self.update_combos()
                 if self._comment_matrix[self._cur_idx[0]][self._cur_idx[1]]['key'] is not None:
                     _input.update(value=self._comment_matrix[self._cur_idx[0]][self._cur_idx[1]]['comment'])
                 else:
@@ -325,11 +456,13 @@ class KillerPlayer:
             elif event in self._button_keys.keys():  # press any number in _sel_window
                 _select_nbr = self._button_keys[event]
                 self.write_nbr(_select_nbr, self._small_nbr)
+                self.update_combos()
 
-            elif event in self._keypress_lst:  # press number keys
+            elif event in self._keypress_nbrs:  # press number keys
                 if not self._input_mode:
-                    _select_nbr = int(event)
+                    _select_nbr = self._keypress_nbrs[event]
                     self.write_nbr(_select_nbr, self._small_nbr)
+                    self.update_combos()
 
             elif event == '_Play_Small_':  # change to small mode
                 self._small_nbr = values['_Play_Small_']
@@ -349,9 +482,10 @@ class KillerPlayer:
                     self._small_nbr = not _cur_sn
 
             elif event == '_Play_Clear_':  # clear player
-                self.clear_player()
                 self.reset_all()
                 self._json_data = {'sum_groups': [], 'known_numbers': []}
+                self.update_shape()
+                self.clear_player()
 
                 self._title.hide_row()
 
@@ -363,15 +497,16 @@ class KillerPlayer:
                 if not _json_data:
                     continue
                 self._json_data = _json_data
-                draw_file(self._grid_parameters, self._json_data, self._graph_size, self._graph, self._title)
+                self.update_shape()
+                self.draw_puzzle()
 
                 self.reset_all()
 
             elif event == '_Play_Save_':
                 # put all numbers in _json_data
                 _known_nbrs = []
-                for i in range(9):
-                    for j in range(9):
+                for i in range(self._grid_size):
+                    for j in range(self._grid_size):
                         if self._text_matrix[i][j]['small'] is not None:
                             _known_nbrs.append({'coord': (i, j),
                                                 'small': self._text_matrix[i][j]['small'],
@@ -381,28 +516,53 @@ class KillerPlayer:
                 save_dialog(self._grid_parameters, self._json_data)
 
             elif event == '_Play_Solve_':
-                if self._json_data is None:
+                if self._json_data is None or _solver.running:
                     continue
-                if 'known_numbers' not in self._json_data or not self._json_data['known_numbers']:
-                    _known_nbrs = []
-                    for i in range(9):
-                        for j in range(9):
-                            if self._text_matrix[i][j]['small'] is not None:
-                                _known_nbrs.append({'coord': (i, j),
-                                                    'small': self._text_matrix[i][j]['small'],
-                                                    'possible_numbers': self._text_matrix[i][j]['possible_numbers']})
+                _known_nbrs = []
+                for i in range(self._grid_size):
+                    for j in range(self._grid_size):
+                        if self._text_matrix[i][j]['small'] is not None:
+                            _known_nbrs.append({'coord': (i, j),
+                                                'small': self._text_matrix[i][j]['small'],
+                                                'possible_numbers': self._text_matrix[i][j]['possible_numbers']})
+                _hints = None
+                if self._configs["solver"].get("warm_start"):
+                    # the numbers and the notes of the player are a starting point, not givens
+                    _hints = _known_nbrs
+                    if 'known_numbers' not in self._json_data:
+                        self._json_data['known_numbers'] = []
+                elif 'known_numbers' not in self._json_data or not self._json_data['known_numbers']:
                     self._json_data['known_numbers'] = _known_nbrs
-                try:
-                    self._json_data['known_numbers'] = sudoku_solve(self._json_data, self._configs["solver"].copy())
-                    draw_file(self._grid_parameters, self._json_data, self._graph_size, self._graph, self._title)
-                except Exception as e:
-                    print(e)
+                # solve in the background, the result comes back as the _Play_Solved_ event
+                _solver.start(sudoku_solve,
+                              (self._json_data, self._configs["solver"].copy(), None, _hints),
+                              self._configs["solver"].get("time_limit"))
+                _solve_button.update(disabled=True)
+                _cancel_button.update(visible=True)
+
+            elif event == '_Play_Cancel_':
+                _solver.cancel()
+
+            elif event == '_Play_Solved_':
+                _solve_button.update(disabled=False)
+                _cancel_button.update(visible=False)
+                _solving_text.update(value='')
+                _status, _result = values[event]
+                if _status == 'ok' and _result:
+                    self._json_data['known_numbers'] = _result
+                    # only the cells which changed, the puzzle image stays
+                    self.set_numbers(_result)
+                elif _status == 'timeout':
+                    sg.popup_error(self._configs["lang_dict"]["_Error_Timeout_"])
+                elif _status != 'cancelled':
+                    print(_result)
                     sg.popup_error(self._configs["lang_dict"]["_Error_Solver_"])
 
             elif event == '_Play_Design_':  # go to designer
                 if sg.popup_ok_cancel(self._configs["lang_dict"]["_Exit_Popup_"]) == 'OK':
                     from KillerMaker import KillerMaker
 
+                    _solver.cancel()
                     window.close()
                     km = KillerMaker(self._configs)
                     km.init_window()
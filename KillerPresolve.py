@@ -0,0 +1,161 @@
+from functools import lru_cache
+from itertools import combinations
+
+from GridHelper import grid_shape, regions_key
+from KillerEngine import default_regions
+
+MAX_GROUP = 4  # the largest implied group added as a cage
+
+
+@lru_cache(maxsize=32)
+def unit_unions(size: int = 9, regions_key: tuple = None, box: tuple = None) -> tuple:
+    """
+    the unions of units whose sum is known: runs of consecutive rows, runs of consecutive cols,
+    every region and every pair of regions
+
+    :param size: the number of rows (cols) of the grid
+    :param regions_key: All regions in the grid (as tuples, see GridHelper.regions_key), None for the boxes
+    :param box: (rows, cols) of a box
+    :return: tuple of (cell mask, number of units in the union), bit row * size + col is the cell
+    """
+    regions = default_regions(size, box) if regions_key is None else regions_key
+    region_masks = [cells_mask(region, size) for region in regions]
+    unions = []
+    for length in range(1, size):
+        for start in range(size - length + 1):
+            lines = range(start, start + length)
+            unions.append((cells_mask([(i, j) for i in lines for j in range(size)], size), length))
+            unions.append((cells_mask([(i, j) for j in lines for i in range(size)], size), length))
+    unions += [(mask, 1) for mask in region_masks]
+    unions += [(mask_a | mask_b, 2) for mask_a, mask_b in combinations(region_masks, 2)]
+    return tuple(unions)
+
+
+def cells_mask(coords, size: int) -> int:
+    """
+    :param coords: iterable of (row, col)
+    :param size: the number of rows (cols) of the grid
+    :return: the cells as a bit mask, bit row * size + col is the cell
+    """
+    mask = 0
+    for a, b in coords:
+        mask |= 1 << (a * size + b)
+    return mask
+
+
+def mask_cells(mask: int, size: int) -> list:
+    """
+    :param mask: the cells as a bit mask
+    :param size: the number of rows (cols) of the grid
+    :return: list of (row, col) of the cells
+    """
+    cells = []
+    while mask:
+        cell = (mask & -mask).bit_length() - 1
+        cells.append((cell // size, cell % size))
+        mask &= mask - 1
+    return cells
+
+
+def sees(cell_a: tuple, cell_b: tuple, region_of: dict, cage_of: dict) -> bool:
+    """
+    :return: whether the two cells can not have the same digit (same row, col, region or cage)
+    """
+    return (cell_a[0] == cell_b[0] or cell_a[1] == cell_b[1]
+            or region_of[cell_a] == region_of[cell_b] or cage_of[cell_a] == cage_of[cell_b])
+
+
+def implied_groups(json_data: dict, regions=None, max_group: int = MAX_GROUP) -> (dict, list):
+    """
+    rule of 45: every union of rows, cols or regions sums to a multiple of 45 (of size * (size + 1) / 2).
+    The cells of a union not covered by the cages inside it (innies) and the cells outside
+    of the cages which cover it (outies) have a known sum. One cell is fixed, it can fix more cells
+    of other unions, a small group of cells which see each other is a new cage
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param regions: All regions in the grid (the regions in json_data or the boxes if not given)
+    :param max_group: the largest implied group returned
+    :return: dict of fixed (row, col) -> digit, and list of implied groups (sorted coords, sum)
+    """
+    size, box = grid_shape(json_data)
+    if regions is None:
+        regions = json_data.get('regions')
+    unit_sum = size * (size + 1) // 2
+
+    cages = [(cells_mask(sum_group['coords'], size), sum_group['sum']) for sum_group in json_data.get('sum_groups', [])]
+    cage_of = {cell: idx for idx, sum_group in enumerate(json_data.get('sum_groups', []))
+               for cell in map(tuple, sum_group['coords'])}
+    if len(cage_of) != size * size:  # only when every cell is in a cage
+        return {}, []
+    region_of = {tuple(coord): idx for idx, region in enumerate(regions or default_regions(size, box))
+                 for coord in region}
+
+    known = {}
+    for known_number in json_data.get('known_numbers', []):
+        if not known_number['small']:
+            a, b = known_number['coord']
+            known[a * size + b] = known_number['possible_numbers'][0]
+    known_mask = cells_mask([divmod(cell, size) for cell in known], size)
+    fixed = {}
+
+    # the innies and outies of every union (only the cages crossing its border have them),
+    # only the known cells change below
+    candidates = {}
+    for union, nbr_units in unit_unions(size, regions_key(regions), box):
+        inside_sum, innies, outies, outie_sum = 0, 0, 0, 0
+        for cage, cage_sum in cages:
+            if not cage & union:
+                continue
+            if cage & ~union:
+                innies |= cage & union
+                outies |= cage & ~union
+                outie_sum += cage_sum
+            else:
+                inside_sum += cage_sum
+        candidates[innies] = nbr_units * unit_sum - inside_sum
+        candidates[outies] = outie_sum + inside_sum - nbr_units * unit_sum
+    candidates.pop(0, None)
+
+    groups = {}
+    changed = True
+    while changed:
+        changed = False
+        groups = {}
+        for group, group_sum in candidates.items():
+            unknown = group & ~known_mask
+            if bin(unknown).count('1') > max_group:
+                continue
+            group_sum -= sum(known[a * size + b] for a, b in mask_cells(group & known_mask, size))
+            cells = mask_cells(unknown, size)
+            if len(cells) == 1:
+                if not 0 < group_sum <= size:  # the puzzle has no solution, leave it to the solver
+                    continue
+                a, b = cells[0]
+                known[a * size + b] = fixed[cells[0]] = group_sum
+                known_mask |= unknown
+                changed = True
+            elif len(cells) > 1 and all(sees(a, b, region_of, cage_of) for a, b in combinations(cells, 2)):
+                groups[unknown] = (cells, group_sum)
+
+    real_cages = set(cage & ~known_mask for cage, _ in cages)
+    return fixed, [(cells, group_sum) for group, (cells, group_sum) in groups.items() if group not in real_cages]
+
+
+def presolve(json_data: dict, regions=None, max_group: int = MAX_GROUP) -> (dict, int, int):
+    """
+    add the cells fixed by the rule of 45 as known numbers, and the implied groups as cages,
+    so the solver starts from a smaller problem (see implied_groups)
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param regions: All regions in the grid
+    :param max_group: the largest implied group added as a cage
+    :return: the json dict to solve (a copy, json_data is unchanged), the number of fixed cells
+    and the number of implied groups
+    """
+    fixed, groups = implied_groups(json_data, regions, max_group)
+    if not fixed and not groups:
+        return json_data, 0, 0
+    known_nbrs = json_data.get('known_numbers', []) + [{'coord': coord, 'small': False, 'possible_numbers': [k]}
+                                                       for coord, k in fixed.items()]
+    sum_groups = json_data['sum_groups'] + [{'coords': coords, 'sum': group_sum} for coords, group_sum in groups]
+    return dict(json_data, known_numbers=known_nbrs, sum_groups=sum_groups), len(fixed), len(groups)
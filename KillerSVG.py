@@ -1,118 +1,129 @@
 import io
+import sys
+from functools import lru_cache
 
 import cairo  # https://pycairo.readthedocs.io/
 
+from GridHelper import calc_size, grid_shape, line_box, regions_key
 
-def get_points_pos(group: list, cell: (int, int)) -> list:
+
+@lru_cache(maxsize=None)
+def trace_outline(shape: tuple) -> tuple:
     """
-    from a list of cell indexes find out which corner
-    of the cell will have a point (corner) in the sum group.
+    trace the outline of a cage shape along the boundary edges of its cells,
+    the edges go clockwise (the cage is on the right side), each edge is used once.
+    Every corner is given as the cell inside the corner and the corner of that cell
 
-    :param group: list of cell indexes of a group
-    :param cell: current cell index need to process
-    :return: list of point positions of this cell
+    :param shape: sorted tuple of cell indexes of the cage, moved to start at row 0 and col 0
+    :return: tuple of closed contours (the outline, and more if the cage has holes or
+    cells only touching at corners), each one a tuple of (cell index, point position)
     (tl: top left, tr: top right, bl: bottom left, br: bottom right)
     """
-    result = []
-    cell_row = cell[0]
-    cell_col = cell[1]
-    cell_tl = (cell_row - 1, cell_col - 1) in group
-    cell_tc = (cell_row - 1, cell_col) in group
-    cell_tr = (cell_row - 1, cell_col + 1) in group
-    cell_cl = (cell_row, cell_col - 1) in group
-    cell_cr = (cell_row, cell_col + 1) in group
-    cell_bl = (cell_row + 1, cell_col - 1) in group
-    cell_bc = (cell_row + 1, cell_col) in group
-    cell_br = (cell_row + 1, cell_col + 1) in group
-    if all([cell_tc, cell_cl]) and not cell_tl:
-        result.append('tl')
-    elif not any([cell_tl, cell_tc, cell_cl]):
-        result.append('tl')
-    if all([cell_tc, cell_cr]) and not cell_tr:
-        result.append('tr')
-    elif not any([cell_tc, cell_tr, cell_cr]):
-        result.append('tr')
-    if all([cell_cl, cell_bc]) and not cell_bl:
-        result.append('bl')
-    elif not any([cell_cl, cell_bl, cell_bc]):
-        result.append('bl')
-    if all([cell_cr, cell_bc]) and not cell_br:
-        result.append('br')
-    elif not any([cell_cr, cell_bc, cell_br]):
-        result.append('br')
-    return result
-
-
-def get_points_order(drawing_pts: list) -> list:
+    cells = set(shape)
+    # grid vertex -> the directions (row, col) of the edges starting there
+    edges = {}
+    for row, col in shape:
+        if (row - 1, col) not in cells:
+            edges.setdefault((row, col), []).append((0, 1))
+        if (row, col + 1) not in cells:
+            edges.setdefault((row, col + 1), []).append((1, 0))
+        if (row + 1, col) not in cells:
+            edges.setdefault((row + 1, col + 1), []).append((0, -1))
+        if (row, col - 1) not in cells:
+            edges.setdefault((row + 1, col), []).append((-1, 0))
+
+    contours = []
+    for start in list(edges):
+        path = []
+        vertex, direction = start, None
+        while edges.get(vertex):
+            outs = edges[vertex]
+            if direction is not None and len(outs) > 1 and (direction[1], -direction[0]) in outs:
+                # two cells only touching at this corner: turn right, so they get separate contours
+                outs.remove((direction[1], -direction[0]))
+                direction = (direction[1], -direction[0])
+            else:
+                direction = outs.pop()
+            path.append((vertex, direction))
+            vertex = (vertex[0] + direction[0], vertex[1] + direction[1])
+            if vertex == start:
+                break
+
+        contour = []
+        for i, (vertex, out_dir) in enumerate(path):
+            in_dir = path[i - 1][1]
+            if in_dir == out_dir:
+                continue
+            # the cage is on the right side of both edges
+            normal_row, normal_col = in_dir[1] + out_dir[1], -in_dir[0] - out_dir[0]
+            cell = (vertex[0] if normal_row > 0 else vertex[0] - 1,
+                    vertex[1] if normal_col > 0 else vertex[1] - 1)
+            contour.append((cell, ('t' if normal_row > 0 else 'b') + ('l' if normal_col > 0 else 'r')))
+        if contour:
+            contours.append(tuple(contour))
+    return tuple(contours)
+
+
+@lru_cache(maxsize=4096)
+def outline_points(group: tuple, boarders: tuple, y_boarders: tuple, cell_size: float, inset: float) -> tuple:
     """
-    sort all drawing points in order.
-
-    :param drawing_pts: list containing all information of the drawing points (of a sum group)
-    :return: list of all drawing points in the order
+    the drawing coordinates of the outline of a cage, inset from the cell borders
+    (the same cage and grid parameters are only calculated once, also for another image size)
+
+    :param group: sorted tuple of cell indexes of the cage
+    :param boarders: the x coordinates of the cols
+    :param y_boarders: the y coordinates of the rows
+    :param cell_size: the size of a cell
+    :param inset: the distance from the cell borders
+    :return: tuple of closed contours, each one a tuple of (x, y)
     """
-    drawing_order = []
-
-    # first_pts_x = drawing_pts[0]['x']
-    # first_pts_y = drawing_pts[0]['y']
-    cur_pts_x = drawing_pts[0]['x']
-    cur_pts_y = drawing_pts[0]['y']
-
-    drawing_pts = drawing_pts[1:]
-    cur_dir_x = True  # draw to which direction
-    drawing_order.append((cur_pts_x, cur_pts_y))
-
-    while len(drawing_pts) != 0:
-        pts_on_axis = []
-        num_dup_dir = {False: 0, True: 0}
-        for pt in drawing_pts:
-            # draw on y axis
-            if cur_dir_x and pt['x'] == cur_pts_x:
-                pt_on_axis = pt
-                pt_diff = pt_on_axis['y'] - cur_pts_y
-                # calculate the direction and distance
-                pt_on_axis['direction'] = pt_diff > 0
-                pt_on_axis['diff'] = abs(pt_diff)
-                num_dup_dir[pt_on_axis['direction']] += 1
-                pts_on_axis.append(pt_on_axis)
-            # draw on x axis
-            elif not cur_dir_x and pt['y'] == cur_pts_y:
-                pt_on_axis = pt
-                pt_diff = pt_on_axis['x'] - cur_pts_x
-                # calculate the direction and distance
-                pt_on_axis['direction'] = pt_diff > 0
-                pt_on_axis['diff'] = abs(pt_diff)
-                num_dup_dir[pt_on_axis['direction']] += 1
-                pts_on_axis.append(pt_on_axis)
-        if not pts_on_axis:
-            return drawing_order + get_points_order(drawing_pts)
-
-        # count the number of pts in each dir
-        if num_dup_dir[False] % 2 != 0:
-            direction = False
-        elif num_dup_dir[True] % 2 != 0:
-            direction = True
-        else:
-            direction = None
-
-        # go to odd direction
-        if direction is not None:
-            pts_on_axis = [pt for pt in pts_on_axis if pt['direction'] == direction]
-
-        pts_diff = [pt['diff'] for pt in pts_on_axis]
-        pt_drop = pts_diff.index(min(pts_diff))
-        # select the pt need to be draw next
-        select_pt = pts_on_axis[pt_drop]
+    top = min(row for row, _ in group)
+    left = min(col for _, col in group)
+    shape = tuple((row - top, col - left) for row, col in group)
+
+    contours = []
+    for contour in trace_outline(shape):
+        points = []
+        for (row, col), point_pos in contour:
+            row, col = row + top, col + left
+            # _cell_pos[0] is row = y, [1] is col = x
+            if point_pos[1] == 'l':
+                _x = boarders[col] + inset
+            else:
+                _x = boarders[col] + cell_size - inset
+            if point_pos[0] == 't':
+                _y = y_boarders[row] + inset
+            else:
+                _y = y_boarders[row] + cell_size - inset
+            points.append((_x, _y))
+        contours.append(tuple(points))
+    return tuple(contours)
 
-        # go to current pt
-        cur_pts_x, cur_pts_y = select_pt['x'], select_pt['y']
-        drawing_order.append((cur_pts_x, cur_pts_y))
 
-        # delete the current pt in df
-        drawing_pts.remove(select_pt)
-        # change the current direction
-        cur_dir_x = not cur_dir_x
+@lru_cache(maxsize=16)
+def grid_layer(grid_parameters: tuple, regions: tuple = None, img_size: int = None):
+    """
+    the static layer (grid lines, region borders and labels) drawn once,
+    the cages and numbers of every puzzle are drawn on top of it
 
-    return drawing_order
+    :param grid_parameters: the grid parameters as a tuple of (key, value) (see KillerSVG.layer_key)
+    :param regions: All regions in the grid (as tuples, see GridHelper.regions_key), None for the boxes
+    :param img_size: size of the image layer, None for a vector (recording) layer
+    :return: cairo surface of the layer
+    """
+    ksvg = KillerSVG(dict(grid_parameters))
+    if img_size is None:
+        surface = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA,
+                                         cairo.Rectangle(0, 0, ksvg._gp['size'], ksvg._gp['size']))
+        ksvg._context = cairo.Context(surface)
+    else:
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, img_size, img_size)
+        ksvg._context = cairo.Context(surface)
+        ksvg._context.scale(img_size / ksvg._gp['size'], img_size / ksvg._gp['size'])
+    ksvg._context.scale(ksvg._gp['scale'], ksvg._gp['scale'])
+    ksvg.draw_static(regions)
+    surface.flush()
+    return surface
 
 
 class KillerSVG:
@@ -129,37 +140,64 @@ class KillerSVG:
 
     def draw_grid(self):
         """
-        Draw the sudoku 9x9 grid on the surface
+        Draw the sudoku grid (9x9 or the size in the grid parameters) on the surface
         """
-        _grid_tl = self._gp['boarders'][0] - self._gp['main_width'] / 2
-        _grid_size = self._gp['cell_size'] * 9 + self._gp['main_width'] * 3 + self._gp['inside_width'] * 6
+        _box_rows, _box_cols = self._gp['box']
+        _x_start = self._gp['boarders'][0] - self._gp['main_width'] / 2
+        _x_end = self._gp['boarders'][-1] - self._gp['main_width'] / 2
+        _y_start = self._gp['y_boarders'][0] - self._gp['main_width'] / 2
+        _y_end = self._gp['y_boarders'][-1] - self._gp['main_width'] / 2
 
         self._context.set_source_rgb(0, 0, 0)
 
         self._context.set_line_width(self._gp['main_width'])
-        self._context.rectangle(_grid_tl, _grid_tl, _grid_size, _grid_size)
+        self._context.rectangle(_x_start, _y_start, _x_end - _x_start, _y_end - _y_start)
+        self._context.stroke()
+
+        for i in range(self._gp['grid_size'] - 1):
+            # vertical lines, bold between the boxes
+            _line_width = self._gp['main_width'] if (i + 1) % _box_cols == 0 else self._gp['inside_width']
+            cur_position = self._gp['boarders'][i + 1] - _line_width / 2
+            self._context.set_line_width(_line_width)
+            self._context.move_to(cur_position, _y_start)
+            self._context.line_to(cur_position, _y_end)
+            self._context.stroke()
+
+            # horizontal lines
+            _line_width = self._gp['main_width'] if (i + 1) % _box_rows == 0 else self._gp['inside_width']
+            cur_position = self._gp['y_boarders'][i + 1] - _line_width / 2
+            self._context.set_line_width(_line_width)
+            self._context.move_to(_x_start, cur_position)
+            self._context.line_to(_x_end, cur_position)
+            self._context.stroke()
+
+    def draw_regions(self, _regions: list):
+        """
+        draw the bold borders between the irregular regions of a jigsaw puzzle
+        (the grid is drawn without box lines, see GridHelper.line_box)
+
+        :param _regions: list of regions, each region is a list of cell indexes
+        """
+        _region_idx = {}
+        for idx, region in enumerate(_regions):
+            for coord in region:
+                _region_idx[tuple(coord)] = idx
+
+        self._context.set_source_rgb(0, 0, 0)
+        self._context.set_line_width(self._gp['main_width'])
+        for i in range(self._gp['grid_size']):
+            for j in range(self._gp['grid_size'] - 1):
+                # between (i, j) and (i, j + 1)
+                if _region_idx[(i, j)] != _region_idx[(i, j + 1)]:
+                    cur_position = self._gp['boarders'][j + 1] - self._gp['inside_width'] / 2
+                    self._context.move_to(cur_position, self._gp['y_boarders'][i] - self._gp['main_width'])
+                    self._context.line_to(cur_position, self._gp['y_boarders'][i + 1])
+                # between (j, i) and (j + 1, i)
+                if _region_idx[(j, i)] != _region_idx[(j + 1, i)]:
+                    cur_position = self._gp['y_boarders'][j + 1] - self._gp['inside_width'] / 2
+                    self._context.move_to(self._gp['boarders'][i] - self._gp['main_width'], cur_position)
+                    self._context.line_to(self._gp['boarders'][i + 1], cur_position)
         self._context.stroke()
-        _grid_start = _grid_tl
-        _grid_end = _grid_tl + _grid_size
-        # cur_position = _grid_tl + _main_width / 2
-
-        for i in range(8):
-            if i in (2, 5):
-                cur_position = self._gp['boarders'][i + 1] - self._gp['main_width'] / 2
-                self._context.set_line_width(self._gp['main_width'])
-                self._context.move_to(cur_position, _grid_start)
-                self._context.line_to(cur_position, _grid_end)
-                self._context.move_to(_grid_start, cur_position)
-                self._context.line_to(_grid_end, cur_position)
-                self._context.stroke()
-            else:
-                cur_position = self._gp['boarders'][i + 1] - self._gp['inside_width'] / 2
-                self._context.set_line_width(self._gp['inside_width'])
-                self._context.move_to(cur_position, _grid_start)
-                self._context.line_to(cur_position, _grid_end)
-                self._context.move_to(_grid_start, cur_position)
-                self._context.line_to(_grid_end, cur_position)
-                self._context.stroke()
 
     def draw_labels(self):
         """
@@ -167,16 +205,17 @@ class KillerSVG:
         """
         self._context.select_font_face("sans-serif")
         self._context.set_font_size(self._gp['grid_label_font'])
-        for i in range(9):
+        for i in range(self._gp['grid_size']):
             _grid_label_tl_s = self._gp['white_boarder_width']
-            _grid_label_tl_l = self._gp['boarders'][i]
+            _grid_label_tl_l = self._gp['y_boarders'][i]
+            _grid_label_tl_x = self._gp['boarders'][i]
             self._context.set_source_rgb(0.8, 0.8, 0.8)
             self._context.rectangle(_grid_label_tl_s,
                                     _grid_label_tl_l,
                                     self._gp['grid_label_width'],
                                     self._gp['cell_size'])
             self._context.fill()
-            self._context.rectangle(_grid_label_tl_l,
+            self._context.rectangle(_grid_label_tl_x,
                                     _grid_label_tl_s,
                                     self._gp['cell_size'],
                                     self._gp['grid_label_width'])
@@ -190,63 +229,22 @@ class KillerSVG:
             self._context.show_text(_text_l)
             _text_u = str(i + 1)
             _textex = self._context.text_extents(_text_u)
-            self._context.move_to(_grid_label_tl_l + self._gp['cell_size'] / 2 - _textex[0] - _textex[2] / 2,
+            self._context.move_to(_grid_label_tl_x + self._gp['cell_size'] / 2 - _textex[0] - _textex[2] / 2,
                                   _grid_label_tl_s + self._gp['grid_label_width'] / 2 - _textex[1] - _textex[3] / 2)
             self._context.show_text(_text_u)
 
-    def get_grid_point(self, _cell: (int, int), _point_pos: str) -> (float, float):
-        """
-        calculates the coordinates on the surface by the cell index and the position of the point
-
-        :param _cell: the current cell index
-        :param _point_pos: the point position in the cell
-        :return: the drawing coordinates (regarding the surface)
-        """
-        # _cell_pos[0] is row = y, [1] is col = x
-        if _point_pos == 'tl':
-            _tl_x = (self._gp['boarders'][_cell[1]] +
-                     self._gp['inside_box_boarder'] + self._gp['inside_width'] / 2)
-            _tl_y = (self._gp['boarders'][_cell[0]] +
-                     self._gp['inside_box_boarder'] + self._gp['inside_width'] / 2)
-            return _tl_x, _tl_y
-        elif _point_pos == 'tr':
-            _tr_x = (self._gp['boarders'][_cell[1]] + self._gp['cell_size'] -
-                     self._gp['inside_box_boarder'] - self._gp['inside_width'] / 2)
-            _tr_y = (self._gp['boarders'][_cell[0]] +
-                     self._gp['inside_box_boarder'] + self._gp['inside_width'] / 2)
-            return _tr_x, _tr_y
-        elif _point_pos == 'bl':
-            _bl_x = (self._gp['boarders'][_cell[1]] +
-                     self._gp['inside_box_boarder'] + self._gp['inside_width'] / 2)
-            _bl_y = (self._gp['boarders'][_cell[0]] + self._gp['cell_size'] -
-                     self._gp['inside_box_boarder'] - self._gp['inside_width'] / 2)
-            return _bl_x, _bl_y
-        elif _point_pos == 'br':
-            _br_x = (self._gp['boarders'][_cell[1]] + self._gp['cell_size'] -
-                     self._gp['inside_box_boarder'] - self._gp['inside_width'] / 2)
-            _br_y = (self._gp['boarders'][_cell[0]] + self._gp['cell_size'] -
-                     self._gp['inside_box_boarder'] - self._gp['inside_width'] / 2)
-            return _br_x, _br_y
-
-    def get_drawing_points(self, _group: list) -> list:
-        """
-        Produce a DataFrame of all drawing points (without order)
+    def get_outline(self, _group: list) -> tuple:
+        """
+        the outline of a sum group with the current grid parameters (see outline_points)
 
         :param _group: list of cell indexes in a sum group
-        :return: json list containing all drawing points info in a sum group
-        # :return: DataFrame containing all drawing coordinates and their cells and the point positions
-        """
-        _drawing_pts = []
-        for i in range(0, len(_group)):
-            _cur_cell = _group[i]
-            _cur_points = get_points_pos(_group, _cur_cell)
-            for pts in _cur_points:
-                _pt_x, _pt_y = self.get_grid_point(_cur_cell, pts)
-                _drawing_pts.append({'cell': _cur_cell,
-                                     'pos': pts,
-                                     'x': _pt_x,
-                                     'y': _pt_y})
-        return _drawing_pts
+        :return: tuple of closed contours, each one a tuple of drawing coordinates
+        """
+        return outline_points(tuple(sorted(tuple(cell) for cell in _group)),
+                              tuple(self._gp['boarders']),
+                              tuple(self._gp['y_boarders']),
+                              self._gp['cell_size'],
+                              self._gp['inside_box_boarder'] + self._gp['inside_width'] / 2)
 
     def draw_sum_group(self, _sum_group: dict):
         """
@@ -258,28 +256,12 @@ class KillerSVG:
         self._context.set_dash([self._gp['inside_width'] * 4, self._gp['inside_width'] * 2])
         self._context.set_source_rgb(0, 0, 0)
 
-        # find all pts needed to be connected
-        _drawing_pts = self.get_drawing_points(_sum_group['coords'])
-
-        _drawing_ordered = get_points_order(_drawing_pts)
-
-        _first_pt = _drawing_ordered[0]
-
-        # draw the line by the ordered points
-        self._context.move_to(_first_pt[0], _first_pt[1])
-        _prev_pt = _first_pt
-        for pt in _drawing_ordered[1:]:
-            if pt[0] == _prev_pt[0] or pt[1] == _prev_pt[1]:
+        # draw every contour of the outline
+        for _contour in self.get_outline(_sum_group['coords']):
+            self._context.move_to(_contour[0][0], _contour[0][1])
+            for pt in _contour[1:]:
                 self._context.line_to(pt[0], pt[1])
-            else:
-                # if the group containing two separate contours
-                self._context.line_to(_first_pt[0], _first_pt[1])
-                self._context.move_to(pt[0], pt[1])
-                _first_pt = pt
-            _prev_pt = pt
-
-        # draw the last line back to the first pt
-        self._context.line_to(_first_pt[0], _first_pt[1])
+            self._context.close_path()
         self._context.stroke()
 
         # write sum (all the steps below)
@@ -291,7 +273,7 @@ class KillerSVG:
         self._context.set_source_rgb(1, 1, 1)
         _first_cell = _sum_group['coords'][0]
         _first_cell_x = self._gp['boarders'][_first_cell[1]]  # col
-        _first_cell_y = self._gp['boarders'][_first_cell[0]]  # row
+        _first_cell_y = self._gp['y_boarders'][_first_cell[0]]  # row
         self._context.rectangle(_first_cell_x + self._gp['text_boarder'],
                                 _first_cell_y + self._gp['text_boarder'],
                                 _textex[2] + self._gp['text_boarder'],
@@ -315,7 +297,7 @@ class KillerSVG:
         self._context.set_source_rgb(0, 0, 0)
 
         _cur_cell_x = self._gp['boarders'][_known_number['coord'][1]]
-        _cur_cell_y = self._gp['boarders'][_known_number['coord'][0]]
+        _cur_cell_y = self._gp['y_boarders'][_known_number['coord'][0]]
 
         if not _known_number['small']:
             _cur_nbr = _known_number['possible_numbers'][0]
@@ -325,33 +307,56 @@ class KillerSVG:
                                   _cur_cell_y + self._gp['cell_size'] / 2 - _textex[1] - _textex[3] / 2)
             self._context.show_text(str(_cur_nbr))
         else:
-            self._context.set_font_size(self._gp['cell_small_font'])
+            # 3 small numbers per line in a 9x9 grid, 4 in a 16x16 grid
+            _per_line = -(-self._gp['grid_size'] // int(self._gp['grid_size'] ** 0.5))
+            _small_cell_size = self._gp['small_cell_size'] * 3 / max(_per_line, 3)
+            self._context.set_font_size(self._gp['cell_small_font'] * _small_cell_size / self._gp['small_cell_size'])
             for _cur_nbr in _known_number['possible_numbers']:
-                _nbr_row = (_cur_nbr - 1) // 3
-                _nbr_col = (_cur_nbr - 1) % 3
+                _nbr_row = (_cur_nbr - 1) // _per_line
+                _nbr_col = (_cur_nbr - 1) % _per_line
                 _textex = self._context.text_extents(str(_cur_nbr))
                 # large to small boarder
                 self._context.move_to(_cur_cell_x + self._gp['lts_boarder'] +
-                                      _nbr_col * self._gp['small_cell_size'] +
-                                      self._gp['small_cell_size'] / 2 - _textex[0] - _textex[2] / 2,
+                                      _nbr_col * _small_cell_size +
+                                      _small_cell_size / 2 - _textex[0] - _textex[2] / 2,
                                       _cur_cell_y + self._gp['lts_boarder'] +
-                                      _nbr_row * self._gp['small_cell_size'] +
-                                      self._gp['small_cell_size'] / 2 - _textex[1] - _textex[3] / 2)
+                                      _nbr_row * _small_cell_size +
+                                      _small_cell_size / 2 - _textex[1] - _textex[3] / 2)
                 self._context.show_text(str(_cur_nbr))
 
-    def draw_context(self, _json_data: dict):
+    def layer_key(self) -> tuple:
         """
-        draw the killer sudoku grid on the surface
+        :return: the grid parameters as a hashable tuple, the cache key of the static layer
+        """
+        return tuple(sorted((key, tuple(value) if isinstance(value, list) else value)
+                            for key, value in self._gp.items()))
 
-        :param _json_data: json dictionary containing sum groups and known numbers
+    def draw_static(self, _regions=None):
         """
-        self._context.scale(self._gp['scale'], self._gp['scale'])
+        draw the parts of the image which are the same for every puzzle of the grid shape
 
+        :param _regions: list of regions of a jigsaw puzzle, None for the boxes
+        """
         self.draw_grid()
 
+        if _regions:
+            self.draw_regions(_regions)
+
         if self._gp['grid_label']:
             self.draw_labels()
 
+    def draw_context(self, _json_data: dict, _static: bool = True):
+        """
+        draw the killer sudoku grid on the surface
+
+        :param _json_data: json dictionary containing sum groups and known numbers
+        :param _static: whether to draw the static layer (see draw_static) too
+        """
+        self._context.scale(self._gp['scale'], self._gp['scale'])
+
+        if _static:
+            self.draw_static(_json_data.get('regions'))
+
         if 'sum_groups' in _json_data:
             for sum_group in _json_data['sum_groups']:
                 self.draw_sum_group(sum_group)
@@ -360,51 +365,139 @@ class KillerSVG:
             for known_number in _json_data['known_numbers']:
                 self.draw_known_number(known_number)
 
-    # def draw_killer_svg(self, _json_data: dict, _filename: str = "example.svg"):
-    #     """
-    #     draw the killer sudoku grid on an SVG file surface
-    #     _json_data example: {'sum_groups':[{'coords': [[a,b], [c,d], ...], 'sum': 999}, ...],
-    #                          'known_numbers':[{'coord': [a,b], 'small': , 'possible_numbers': [1, 2, ...]}, ...]}
-    #
-    #     :param _json_data: json dictionary containing sum groups and known numbers
-    #     :param _filename: filename of the output svg
-    #     """
-    #     with cairo.SVGSurface(_filename, self._gp['size'], self._gp['size']) as surface:
-    #         self._context = cairo.Context(surface)
-    #         self.draw_context(_json_data)
-
-    # def draw_svg_bs(self, _json_data: dict):
-    #     with io.BytesIO() as svg_bsio:
-    #         with cairo.SVGSurface(svg_bsio, self._gp['size'], self._gp['size']) as surface:
-    #             self._context = cairo.Context(surface)
-    #             self.draw_context(_json_data)
-    #         svg_bsio.seek(0)
-    #         svg_bs = svg_bsio.read()
-    #
-    #     return svg_bs
+    def render(self, _json_data: dict):
+        """
+        draw the sum groups and known numbers once on a recording surface,
+        the outputs are made from it when they are needed (see KillerRender)
+        _json_data example: {'sum_groups':[{'coords': [[a,b], [c,d], ...], 'sum': 999}, ...],
+                             'known_numbers':[{'coord': [a,b], 'small': , 'possible_numbers': [1, 2, ...]}, ...]}
+
+        :param _json_data: json dictionary containing sum groups and known numbers
+        :return: KillerRender of the puzzle
+        """
+        _grid_size, _box = grid_shape(_json_data)[0], line_box(_json_data)
+        if (self._gp.get('grid_size'), self._gp.get('box')) != (_grid_size, _box):
+            # the parameters were calculated for another grid shape
+            self._gp = calc_size(dict(self._gp), _grid_size, _box)
+
+        _recording = cairo.RecordingSurface(cairo.CONTENT_COLOR_ALPHA,
+                                            cairo.Rectangle(0, 0, self._gp['size'], self._gp['size']))
+        self._context = cairo.Context(_recording)
+        self.draw_context(_json_data, False)
+        _recording.flush()
+        self._context = None
+
+        return KillerRender(_recording, (self.layer_key(), regions_key(_json_data.get('regions') or None)),
+                            self._gp['size'])
 
     def draw(self, _json_data: dict, flag_img=False, img_size=None):
-        svg_bs, img_bs = None, None
-        with io.BytesIO() as svg_bsio:
-            with cairo.SVGSurface(svg_bsio, self._gp['size'], self._gp['size']) as svg_surface:
-                self._context = cairo.Context(svg_surface)
-                self.draw_context(_json_data)
+        """
+        draw the puzzle as svg and (if flag_img) png bytes
+
+        :param _json_data: json dictionary containing sum groups and known numbers
+        :param flag_img: whether the png is needed
+        :param img_size: the size of the png, the size in the grid parameters if not given
+        :return: svg bytes, png bytes (None if not flag_img)
+        """
+        _render = self.render(_json_data)
+        return _render.svg(), _render.png(img_size) if flag_img else None
+
+
+class KillerRender:
+    def __init__(self, _recording, _layer_key: tuple, _size: int):
+        """
+        a puzzle drawn once, replayed on top of the cached static layer to every output
+        the first time it is asked for (and kept for the next time)
 
-            svg_bsio.seek(0)
-            svg_bs = svg_bsio.read()
+        :param _recording: cairo recording surface of the sum groups and known numbers
+        :param _layer_key: the grid parameters and regions of the static layer (see grid_layer)
+        :param _size: the size of the drawing in the grid parameters
+        """
+        self._recording = _recording
+        self._layer_key = _layer_key
+        self._size = _size
+        self._outputs = {}
 
-        if flag_img:
-            if img_size is None:
-                img_size = self._gp['size']
-            img_scale = img_size / self._gp['size']
+    def replay(self, _surface, _img_size: int = None, _background: bool = False):
+        """
+        paint the static layer and the recording on a surface
 
+        :param _surface: the output cairo surface
+        :param _img_size: the size of an image surface, None for a vector surface
+        :param _background: whether to paint a white background first
+        """
+        _context = cairo.Context(_surface)
+        if _background:
+            _context.set_source_rgb(1, 1, 1)
+            _context.paint()
+        _context.set_source_surface(grid_layer(*self._layer_key, _img_size), 0, 0)
+        _context.paint()
+        if _img_size is not None:
+            _context.scale(_img_size / self._size, _img_size / self._size)
+        _context.set_source_surface(self._recording, 0, 0)
+        _context.paint()
+
+    def svg(self) -> bytes:
+        """
+        :return: svg bytes
+        """
+        if 'svg' not in self._outputs:
+            with io.BytesIO() as svg_bsio:
+                with cairo.SVGSurface(svg_bsio, self._size, self._size) as svg_surface:
+                    self.replay(svg_surface)
+                self._outputs['svg'] = svg_bsio.getvalue()
+        return self._outputs['svg']
+
+    def pdf(self) -> bytes:
+        """
+        :return: pdf bytes (one page)
+        """
+        if 'pdf' not in self._outputs:
+            with io.BytesIO() as pdf_bsio:
+                with cairo.PDFSurface(pdf_bsio, self._size, self._size) as pdf_surface:
+                    self.replay(pdf_surface)
+                self._outputs['pdf'] = pdf_bsio.getvalue()
+        return self._outputs['pdf']
+
+    def png(self, img_size: int = None) -> bytes:
+        """
+        :param img_size: the size of the image, the size in the grid parameters if not given
+        :return: png bytes
+        """
+        if img_size is None:
+            img_size = self._size
+        if ('png', img_size) not in self._outputs:
             with io.BytesIO() as img_bsio:
                 with cairo.ImageSurface(cairo.FORMAT_ARGB32, img_size, img_size) as img_surface:
-                    self._context = cairo.Context(img_surface)
-                    self._context.scale(img_scale, img_scale)
-                    self.draw_context(_json_data)
+                    self.replay(img_surface, img_size)
                     img_surface.write_to_png(img_bsio)
-                img_bsio.seek(0)
-                img_bs = img_bsio.read()
+                self._outputs[('png', img_size)] = img_bsio.getvalue()
+        return self._outputs[('png', img_size)]
+
+    def ppm(self, img_size: int = None) -> bytes:
+        """
+        the image on a white background as uncompressed PPM bytes, for the GUI graphs
+        (Tk reads them directly, no PNG compression and decompression on every screen update)
 
-        return svg_bs, img_bs
+        :param img_size: the size of the image, the size in the grid parameters if not given
+        :return: ppm bytes
+        """
+        if img_size is None:
+            img_size = self._size
+        if ('ppm', img_size) not in self._outputs:
+            with cairo.ImageSurface(cairo.FORMAT_RGB24, img_size, img_size) as img_surface:
+                self.replay(img_surface, img_size, True)
+                img_surface.flush()
+                _stride = img_surface.get_stride()
+                _data = bytes(img_surface.get_data())
+            if _stride != img_size * 4:
+                _data = b''.join(_data[i * _stride:i * _stride + img_size * 4] for i in range(img_size))
+
+            # every pixel is 32 bits 0xXXRRGGBB in native byte order
+            _red, _green, _blue = (2, 1, 0) if sys.byteorder == 'little' else (1, 2, 3)
+            _rgb = bytearray(img_size * img_size * 3)
+            _rgb[0::3] = _data[_red::4]
+            _rgb[1::3] = _data[_green::4]
+            _rgb[2::3] = _data[_blue::4]
+            self._outputs[('ppm', img_size)] = b'P6 %d %d 255\n' % (img_size, img_size) + bytes(_rgb)
+        return self._outputs[('ppm', img_size)]
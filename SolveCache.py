@@ -0,0 +1,106 @@
+import copy
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from GridHelper import grid_shape
+
+
+def puzzle_hash(json_data: dict, regions=None) -> str:
+    """
+    a stable hash of the puzzle content (sum groups, given numbers, regions and grid shape),
+    independent of the order of the groups and of the cells in them
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param regions: All regions in the grid (the regions in json_data if not given)
+    :return: hex digest of the puzzle
+    """
+    sum_groups = sorted([sorted([list(coord) for coord in sum_group['coords']]), sum_group['sum']]
+                        for sum_group in json_data.get('sum_groups', []))
+    givens = sorted([list(known_number['coord']), known_number['possible_numbers'][0]]
+                    for known_number in json_data.get('known_numbers', [])
+                    if not known_number['small'])
+    if regions is None:
+        regions = json_data.get('regions')
+    if regions is not None:
+        regions = sorted(sorted([list(coord) for coord in region]) for region in regions)
+    content = [sum_groups, givens, regions]
+    size, box = grid_shape(json_data)
+    if (size, box) != (9, (3, 3)):  # 9x9 puzzles keep their old hashes
+        content.append([size, list(box)])
+    content = json.dumps(content, separators=(',', ':'))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class SolveCache:
+    def __init__(self, max_size: int = 256, folder: str = None):
+        """
+        solutions cache, a bounded LRU in memory plus one json file per puzzle on disk
+
+        :param max_size: maximum number of solutions kept in memory
+        :param folder: the folder of the solution files, None to keep them in memory only
+        """
+        self._max_size = max_size
+        self._folder = folder
+        self._memory = OrderedDict()
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self._folder, key + '.json')
+
+    def get(self, key: str):
+        """
+        look up a solution, from memory first then from disk
+
+        :param key: the puzzle hash
+        :return: list of all known numbers of the solution, None if not cached
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return copy.deepcopy(self._memory[key])
+        if self._folder is None or not os.path.exists(self._file_path(key)):
+            return None
+        try:
+            with open(self._file_path(key), 'r') as f:
+                known_nbrs = json.load(f)
+        except (OSError, ValueError):
+            return None
+        for known_nbr in known_nbrs:
+            known_nbr['coord'] = tuple(known_nbr['coord'])
+        self._remember(key, known_nbrs)
+        return copy.deepcopy(known_nbrs)
+
+    def put(self, key: str, known_nbrs: list):
+        """
+        store a solution in memory and on disk
+
+        :param key: the puzzle hash
+        :param known_nbrs: list of all known numbers of the solution
+        """
+        self._remember(key, copy.deepcopy(known_nbrs))
+        if self._folder is None:
+            return
+        os.makedirs(self._folder, exist_ok=True)
+        # write then rename, so other processes never read a half written file
+        tmp_path = self._file_path(key) + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump([{'coord': list(known_nbr['coord']),
+                        'small': known_nbr['small'],
+                        'possible_numbers': known_nbr['possible_numbers']}
+                       for known_nbr in known_nbrs], f)
+        os.replace(tmp_path, self._file_path(key))
+
+    def _remember(self, key: str, known_nbrs: list):
+        self._memory[key] = known_nbrs
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_size:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """
+        forget all solutions kept in memory (the files on disk are kept)
+        """
+        self._memory.clear()
+
+
+solve_cache = SolveCache(folder=os.path.join(os.getcwd(), 'saved_puzzles', 'solutions'))
@@ -0,0 +1,114 @@
+import multiprocessing as mp
+import os
+import signal
+import threading
+import time
+
+
+def run_in_process(conn, target, args: tuple):
+    """
+    run the target in the solver process and send back the result
+
+    :param conn: the pipe connection to the GUI process
+    :param target: the function to run (e.g. sudoku_solve)
+    :param args: the arguments of the function
+    """
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()  # own process group, so cancel also kills the solver binary started by pulp
+    try:
+        conn.send(('ok', target(*args)))
+    except Exception as e:
+        conn.send(('error', str(e)))
+    conn.close()
+
+
+def kill_process(process: mp.Process):
+    """
+    kill the solver process and everything in its process group,
+    it gets a second to clean up (e.g. a portfolio killing its backends) before SIGKILL
+
+    :param process: the solver process
+    """
+    if not process.is_alive():
+        return
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.join(1)
+            if process.is_alive():
+                os.killpg(process.pid, signal.SIGKILL)
+            return
+        except OSError:  # not in its own group yet
+            pass
+    process.kill()
+
+
+class SolveWorker:
+    def __init__(self, window, done_key: str):
+        """
+        run a solve in a separate process, watched by a background thread,
+        so the window keeps responding. The result is sent back to the window
+        as the done_key event with the value (status, result),
+        status is one of 'ok', 'error', 'timeout' or 'cancelled'
+
+        :param window: the PySimpleGUI window
+        :param done_key: the event key for the result
+        """
+        self._window = window
+        self._done_key = done_key
+        self._process = None
+        self._tic = None
+        self._cancelled = False
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self._tic if self._tic is not None else 0
+
+    def start(self, target, args: tuple, time_limit: float = None):
+        """
+        start the solve
+
+        :param target: the function to run (must be importable, e.g. sudoku_solve)
+        :param args: the arguments of the function
+        :param time_limit: seconds before the solve is killed (None for no limit)
+        """
+        if self.running:
+            return
+        _recv_conn, _send_conn = mp.Pipe(duplex=False)
+        # not a daemon, a portfolio solve starts its own processes
+        self._process = mp.Process(target=run_in_process, args=(_send_conn, target, args))
+        self._cancelled = False
+        self._tic = time.time()
+        self._process.start()
+        _send_conn.close()
+        threading.Thread(target=self._wait, args=(_recv_conn, time_limit), daemon=True).start()
+
+    def _wait(self, conn, time_limit: float):
+        status, result = 'timeout', None
+        try:
+            if conn.poll(time_limit):
+                status, result = conn.recv()
+        except (EOFError, OSError):  # the process was killed
+            status = 'error'
+        if self._cancelled:
+            status, result = 'cancelled', None
+        conn.close()
+        _process = self._process
+        kill_process(_process)
+        _process.join()
+        self._process = None
+        self._tic = None
+        self._window.write_event_value(self._done_key, (status, result))
+
+    def cancel(self):
+        """
+        cancel the running solve, the done_key event is still sent (with 'cancelled')
+        """
+        self._cancelled = True
+        _process = self._process
+        if _process is not None:
+            kill_process(_process)
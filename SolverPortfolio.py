@@ -0,0 +1,138 @@
+import json
+import multiprocessing as mp
+import os
+import signal
+import threading
+import time
+from multiprocessing.connection import wait
+
+from SolveWorker import kill_process, run_in_process
+from SudokuSolve import solve_with_stats
+
+PORTFOLIO_LOG = os.path.join(os.getcwd(), 'saved_puzzles', 'portfolio_stats.jsonl')
+
+
+def backend_name(backend: dict) -> str:
+    """
+    :param backend: the solver config of a backend
+    :return: the name of the backend in the statistics
+    """
+    return backend.get('name', backend['solver'])
+
+
+def raise_exit(signum, frame):
+    raise SystemExit(1)
+
+
+def portfolio_solve(json_data: dict, backends: list, regions=None, time_limit: float = None, hints=None,
+                    stats: dict = None) -> list:
+    """
+    Race several solver backends, each one in its own process.
+    The first solution wins, all other backends are killed.
+    Every race is logged to PORTFOLIO_LOG
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param backends: list of solver configs, e.g. [{"solver": "NATIVE"}, {"solver": "SCIP_CMD"}]
+    :param regions: All regions in the grid
+    :param time_limit: seconds before giving up (None for no limit)
+    :param hints: known numbers from the player (see sudoku_solve)
+    :param stats: dict to fill with the stats of the race and of the winner (see sudoku_solve)
+    :return: list of all known numbers (all large) which is the solution
+    """
+    names = [backend_name(backend) for backend in backends]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError('Duplicate portfolio backends, give them distinct "name"s: ' + ', '.join(duplicates))
+    tic = time.time()
+    processes = []
+    backend_idx = {}
+    finished = {}
+    winner, known_nbrs, winner_stats = None, [], {}
+
+    # killed from the GUI (SIGTERM): still kill the backends on the way out
+    _old_handler = None
+    if threading.current_thread() is threading.main_thread() and hasattr(signal, 'SIGTERM'):
+        _old_handler = signal.signal(signal.SIGTERM, raise_exit)
+    try:
+        for idx, backend in enumerate(backends):
+            _recv_conn, _send_conn = mp.Pipe(duplex=False)
+            _backend_cfg = dict(backend, cache=False)
+            _backend_cfg.pop('name', None)
+            _process = mp.Process(target=run_in_process,
+                                  args=(_send_conn, solve_with_stats, (json_data, _backend_cfg, regions, hints)))
+            _process.start()
+            _send_conn.close()
+            processes.append(_process)
+            backend_idx[_recv_conn] = idx
+
+        pending = list(backend_idx)
+        while pending and winner is None:
+            _remaining = None if time_limit is None else max(0, time_limit - (time.time() - tic))
+            ready = wait(pending, _remaining)
+            if not ready:  # time limit
+                break
+            for conn in ready:
+                pending.remove(conn)
+                idx = backend_idx[conn]
+                try:
+                    status, result = conn.recv()
+                except EOFError:
+                    status, result = 'error', None
+                finished[names[idx]] = time.time() - tic
+                if status == 'ok' and result[0] and winner is None:
+                    winner, (known_nbrs, winner_stats) = idx, result
+    finally:
+        for _process in processes:
+            kill_process(_process)
+            _process.join()
+        if _old_handler is not None:
+            signal.signal(signal.SIGTERM, _old_handler)
+
+    toc = time.time() - tic
+    record = {'time': tic,
+              'backends': names,
+              'winner': None if winner is None else names[winner],
+              'elapsed': toc,
+              'finished': finished}
+    print('Portfolio winner: ' + str(record['winner']) + ' Solve Time: ' + str(toc))
+    if stats is not None:
+        for field in ('solver_status', 'nodes', 'propagations', 'backtracks'):
+            stats[field] = winner_stats.get(field)
+        stats.update(winner=record['winner'], solve_time=toc, finished=finished)
+    try:
+        os.makedirs(os.path.dirname(PORTFOLIO_LOG), exist_ok=True)
+        with open(PORTFOLIO_LOG, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        print(e)
+    return known_nbrs
+
+
+def portfolio_summary(log_path: str = PORTFOLIO_LOG) -> dict:
+    """
+    summarize the portfolio log: races, wins and latencies of every backend
+
+    :param log_path: the path of the portfolio log
+    :return: dict of backend name -> statistics
+    """
+    summary = {}
+    with open(log_path, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            for name in record['backends']:
+                stats = summary.setdefault(name, {'races': 0, 'wins': 0, 'win_latencies': []})
+                stats['races'] += 1
+                if name == record['winner']:
+                    stats['wins'] += 1
+                    stats['win_latencies'].append(record['finished'][name])
+    for stats in summary.values():
+        latencies = sorted(stats.pop('win_latencies'))
+        stats['win_rate'] = stats['wins'] / stats['races']
+        stats['median_win_latency'] = latencies[len(latencies) // 2] if latencies else None
+        stats['max_win_latency'] = latencies[-1] if latencies else None
+    return summary
+
+
+if __name__ == "__main__":
+    for _name, _stats in portfolio_summary().items():
+        print(_name + ': ' + json.dumps(_stats))
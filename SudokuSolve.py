@@ -1,74 +1,383 @@
 import time
+from functools import lru_cache
 
 import pulp as pl  # https://coin-or.github.io/pulp/
 
+from GridHelper import grid_shape, regions_key
+from KillerCanon import canonical_form, map_from_canonical, map_to_canonical
+from KillerCombos import allowed_mask, required_mask
+from KillerEngine import default_regions, engine_solve
+from KillerPresolve import presolve
+from SolveCache import puzzle_hash, solve_cache
 
-def sudoku_solve(json_data: dict, solver_cfg: dict, regions = None) -> list:
+stats_hooks = []  # functions called with the stats record of every solve (see sudoku_solve)
+
+# the solvers with a python API for the "*_CMD" solvers (no LP file, no subprocess)
+IN_PROCESS_SOLVERS = {'GUROBI_CMD': 'GUROBI',
+                      'CPLEX_CMD': 'CPLEX_PY',
+                      'SCIP_CMD': 'SCIP_PY',
+                      'FSCIP_CMD': 'SCIP_PY',
+                      'HiGHS_CMD': 'HiGHS',
+                      'COPT_CMD': 'COPT',
+                      'GLPK_CMD': 'PYGLPK',
+                      'XPRESS': 'XPRESS_PY',
+                      'PULP_CBC_CMD': 'CyLP',
+                      'COIN_CMD': 'CyLP'}
+CMD_ONLY_KEYS = ('path', 'keepFiles', 'tmpDir', 'options')
+
+
+@lru_cache(maxsize=8)
+def base_model(regions_key: tuple = None, size: int = 9, box: tuple = (3, 3)) -> (pl.LpProblem, list):
     """
-    Using Integer Programming to solve the killer sudoku
+    Build the model of the basic sudoku rules once per grid shape and region layout.
+    x[i][j][k - 1] is the binary variable of number k in row i, col j
+
+    :param regions_key: All regions in the grid (as tuples), None for the boxes
+    :param size: the number of rows (cols) of the grid
+    :param box: (rows, cols) of a box
+    :return: the base model (never solved directly, copy it first) and the variables
+    """
+    regions = default_regions(size, box) if regions_key is None else regions_key
+
+    m = pl.LpProblem()
+
+    x = [[[pl.LpVariable(name=f'x_{i}_{j}_{k}', cat='Binary')
+           for k in range(1, size + 1)]  # num
+          for j in range(size)]  # col
+         for i in range(size)]  # row
+
+    for i in range(size):  # row
+        for j in range(size):  # col
+            m += pl.lpSum(x[i][j]) == 1, f'row_{i}_col_{j}'
+
+    for i in range(size):
+        for k in range(size):
+            m += pl.lpSum(x[i][j][k] for j in range(size)) == 1, f'row_{i}_nbr_{k + 1}'
+
+    for j in range(size):
+        for k in range(size):
+            m += pl.lpSum(x[i][j][k] for i in range(size)) == 1, f'col_{j}_nbr_{k + 1}'
+
+    for k in range(size):
+        for idx in range(len(regions)):
+            m += pl.lpSum(x[a][b][k] for a, b in regions[idx]) == 1, f'region_({idx})_({k + 1})'
+
+    return m, x
+
+
+def sudoku_solve(json_data: dict, solver_cfg: dict, regions = None, hints = None, stats: dict = None) -> list:
+    """
+    Solve the killer sudoku, repeated puzzles are answered from the solution cache
+    (with the standard 9x9 boxes and a MIP solver, puzzles are also cached in their canonical form,
+    so symmetric copies of a solved puzzle are hits too).
+    The grid size and the box shape are read from json_data (see GridHelper.grid_shape).
+    Set "cache": false in the solver config to always solve.
+    The rule of 45 fixes cells and adds implied cages before solving (see KillerPresolve),
+    set "presolve": false to solve the puzzle as it is.
+    Every solve fills a stats record (see new_stats) and sends it to all stats_hooks
 
     :param json_data: json dictionary containing sum groups and known numbers
     :param solver_cfg: The config of the solver
-    :param regions: All regions in the grid
+    :param regions: All regions in the grid (the regions in json_data or the boxes if not given)
+    :param hints: known numbers from the player (warm start), small numbers restrict the cells,
+    large numbers are the starting point. If the notes leave no solution, the hints are dropped
+    :param stats: dict to fill with the stats record of the solve
     :return: list of all known numbers (all large) which is the solution
     """
-    solver = pl.getSolverFromDict(solver_cfg)
-    
-    m = pl.LpProblem()
+    tic = time.time()
+    if stats is None:
+        stats = {}
+    stats.update(new_stats(solver_cfg.get('solver')))
 
+    solver_cfg = dict(solver_cfg)
+    use_cache = solver_cfg.pop('cache', True)
+    use_presolve = solver_cfg.pop('presolve', True)
+    solver_cfg.pop('warm_start', None)  # the player decides to send the hints
+    time_limit = solver_cfg.pop('time_limit', None)  # the backends stop, the GUI also kills the solve (SolveWorker)
+    if solver_cfg.pop('in_process', False):
+        solver_cfg = in_process_config(solver_cfg)
+        stats['backend'] = solver_cfg['solver']
     if regions is None:
-        regions = [[(a, b) for a in range(c, c + 3) for b in range(d, d + 3)] for c in [0, 3, 6] for d in [0, 3, 6]]
+        regions = json_data.get('regions')  # jigsaw puzzles keep their regions in the json
 
-    x = {}
-    for i in range(9):  # row
-        for j in range(9):  # col
-            for k in range(1, 10):  # num
-                var_id = str(i) + str(j) + str(k)
-                x[var_id] = pl.LpVariable(name=f'x_({var_id})', cat='Binary')
+    key, canonical_key, transform = None, None, None
+    if use_cache:
+        key = puzzle_hash(json_data, regions)
+        known_nbrs = solve_cache.get(key)
+        if (known_nbrs is None and solver_cfg.get('solver') != 'NATIVE'
+                and regions is None and grid_shape(json_data) == (9, (3, 3))):
+            # symmetric copies of a solved puzzle, the canonical form takes longer than the engine
+            # needs for most puzzles, so only for the other solvers and only if the puzzle itself missed
+            canonical, transform = canonical_form(json_data)
+            canonical_key = puzzle_hash(canonical)
+            known_nbrs = solve_cache.get(canonical_key)
+            if known_nbrs is not None:
+                known_nbrs = map_from_canonical(known_nbrs, transform)
+        if known_nbrs is not None:
+            print('Solve Time: 0 (cached)')
+            stats['cached'] = True
+            return emit_stats(stats, tic, known_nbrs)
 
-    for i in range(9):  # row
-        for j in range(9):  # col
-            m += pl.lpSum(x[str(i) + str(j) + str(k)] for k in range(1, 10)) == 1, f'row_{i}_col_{j}'
+    solve_data = json_data
+    if use_presolve and solver_cfg.get('solver') != 'PORTFOLIO':  # the backends of a portfolio presolve
+        tic_presolve = time.time()
+        solve_data, stats['presolve_fixed'], stats['presolve_groups'] = presolve(json_data, regions)
+        stats['presolve_time'] = time.time() - tic_presolve
 
-    for i in range(9):
-        for k in range(1, 10):
-            m += pl.lpSum(x[str(i) + str(j) + str(k)] for j in range(9)) == 1, f'row_{i}_nbr_{k}'
+    spent = {}  # the times of the attempt with the hints, if it is dropped
+    while True:
+        if solver_cfg.get('solver') == 'NATIVE':  # built-in engine, no external solver needed
+            known_nbrs = engine_solve(solve_data, regions, hints, stats, time_limit)
+            print('Solve Time: ' + str(stats['solve_time']))
+        elif solver_cfg.get('solver') == 'PORTFOLIO':  # race the backends, first answer wins
+            from SolverPortfolio import portfolio_solve
 
-    for j in range(9):
-        for k in range(1, 10):
-            m += pl.lpSum(x[str(i) + str(j) + str(k)] for i in range(9)) == 1, f'col_{j}_nbr_{k}'
+            known_nbrs = portfolio_solve(json_data, solver_cfg['backends'], regions, time_limit, hints, stats)
+        else:
+            known_nbrs = mip_solve(solve_data, solver_cfg, regions, hints, stats, time_limit)
+
+        # only the notes of the hints restrict the model (the large numbers are only a start),
+        # a timeout or a puzzle without solution is not retried
+        if (known_nbrs or stats['solver_status'] != 'Infeasible'
+                or not any(hint['small'] and hint['possible_numbers'] for hint in hints or [])):
+            break
+        print('No solution with the hints, solving without them')
+        stats['hints_dropped'] = True
+        hints = None
+        for field in ('build_time', 'solve_time'):
+            spent[field] = stats[field] or 0
+
+    for field, seconds in spent.items():
+        stats[field] = (stats[field] or 0) + seconds
+
+    if use_cache and known_nbrs:
+        solve_cache.put(key, known_nbrs)
+        if canonical_key is not None:
+            solve_cache.put(canonical_key, map_to_canonical(known_nbrs, transform))
+    return emit_stats(stats, tic, known_nbrs)
+
+
+@lru_cache(maxsize=None)
+def api_available(solver_name: str) -> bool:
+    """
+    :param solver_name: the name of a pulp solver with a python API (e.g. 'GUROBI', 'HiGHS')
+    :return: whether its python package is installed (and licensed)
+    """
+    try:
+        return pl.getSolver(solver_name, msg=False).available()
+    except Exception:
+        return False
 
-    for k in range(1, 10):
-        for idx in range(len(regions)):
-            m += pl.lpSum(x[str(a) + str(b) + str(k)] for a, b in regions[idx]) == 1, f'region_({idx})_({k})'
 
+def in_process_config(solver_cfg: dict) -> dict:
+    """
+    keep the model in memory: a "*_CMD" solver becomes its python API solver (see IN_PROCESS_SOLVERS),
+    the built-in engine is used if there is no API solver installed
+
+    :param solver_cfg: The config of the solver
+    :return: the config of the in-process solver
+    """
+    solver_name = solver_cfg.get('solver')
+    if solver_name in ('NATIVE', 'PORTFOLIO'):
+        return solver_cfg
+    solver_name = IN_PROCESS_SOLVERS.get(solver_name, solver_name)
+    if solver_name.endswith('_CMD') or not api_available(solver_name):
+        print(f"in_process: no python API solver installed for {solver_cfg.get('solver')}, "
+              f"solving with the built-in engine (NATIVE) instead")
+        return {'solver': 'NATIVE'}
+    api_cfg = {key: value for key, value in solver_cfg.items() if key not in CMD_ONLY_KEYS}
+    api_cfg['solver'] = solver_name
+    return api_cfg
+
+
+def new_stats(backend: str) -> dict:
+    """
+    an empty stats record of a solve, the fields are filled by the backends when they know them
+
+    - backend: the solver name in the config (e.g. 'NATIVE', 'GUROBI_CMD')
+    - status: 'solved' or 'no solution', solver_status: the status reported by the backend
+    - cached: whether the solution came from the solution cache
+    - hints_dropped: whether the hints had no solution and were dropped
+    - build_time, solve_time, extract_time, total_time: seconds of each phase
+    (model building, solver wall time, reading the solution, the whole call)
+    - nodes, propagations, backtracks: search statistics (None if the backend does not tell)
+    - presolve_fixed, presolve_groups, presolve_time: cells fixed and cages added by the rule of 45,
+    and its seconds (None without presolve)
+
+    :param backend: the solver name in the config
+    :return: the stats record
+    """
+    return {'backend': backend,
+            'status': None,
+            'solver_status': None,
+            'cached': False,
+            'hints_dropped': False,
+            'build_time': None,
+            'solve_time': None,
+            'extract_time': None,
+            'total_time': None,
+            'nodes': None,
+            'propagations': None,
+            'backtracks': None,
+            'presolve_fixed': None,
+            'presolve_groups': None,
+            'presolve_time': None}
+
+
+def emit_stats(stats: dict, tic: float, known_nbrs: list) -> list:
+    """
+    finish the stats record of a solve and send it to all stats_hooks
+
+    :param stats: the stats record
+    :param tic: the start time of the solve
+    :param known_nbrs: the solution
+    :return: the solution (unchanged)
+    """
+    stats['status'] = 'solved' if known_nbrs else 'no solution'
+    stats['total_time'] = time.time() - tic
+    for hook in stats_hooks:
+        try:
+            hook(stats)
+        except Exception as e:  # a broken hook never breaks the solve
+            print(e)
+    return known_nbrs
+
+
+def solve_with_stats(json_data: dict, solver_cfg: dict, regions = None, hints = None) -> (list, dict):
+    """
+    sudoku_solve, also returning the stats record (e.g. to send it back from a worker process)
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param solver_cfg: The config of the solver
+    :param regions: All regions in the grid
+    :param hints: known numbers from the player (warm start)
+    :return: list of all known numbers (all large) which is the solution, and the stats record
+    """
+    stats = {}
+    known_nbrs = sudoku_solve(json_data, solver_cfg, regions, hints, stats)
+    return known_nbrs, stats
+
+
+def mip_solve(json_data: dict, solver_cfg: dict, regions = None, hints = None, stats: dict = None,
+              time_limit: float = None) -> list:
+    """
+    Using Integer Programming to solve the killer sudoku
+
+    :param json_data: json dictionary containing sum groups and known numbers
+    :param solver_cfg: The config of the solver
+    :param regions: All regions in the grid (the regions in json_data or the boxes if not given)
+    :param hints: known numbers from the player, small numbers fix the other numbers of the cell to 0,
+    large numbers are the MIP start
+    :param stats: dict to fill with the time of each phase and the solver status (see sudoku_solve)
+    :param time_limit: seconds before the solver gives up, the timeLimit of the pulp solver
+    (None for no limit, a timeLimit in the config is kept)
+    :return: list of all known numbers (all large) which is the solution
+    """
+    tic_build = time.time()
+    size, box = grid_shape(json_data)
+    if regions is None:
+        regions = json_data.get('regions')
+    base_m, x = base_model(regions_key(regions), size, box)
+    m = base_m.copy()  # only the constraints of this puzzle are added to the copy
+
+    region_of = {tuple(coord): idx for idx, region in enumerate(regions or default_regions(size, box))
+                 for coord in region}
     for i, sum_group in enumerate(json_data['sum_groups']):
-        m += pl.lpSum(k * x[str(a) + str(b) + str(k)]
-                      for a, b in sum_group['coords']
-                      for k in range(1, 10)) == sum_group['sum'], f'sum({i})'
+        _coords = [tuple(coord) for coord in sum_group['coords']]
+        m += pl.lpSum(k * x[a][b][k - 1]
+                      for a, b in _coords
+                      for k in range(1, size + 1)) == sum_group['sum'], f'sum({i})'
+        # digits not in any combination of the cage
+        _allowed = allowed_mask(sum_group['sum'], len(_coords), 0, size)
+        _not_allowed = [k for k in range(1, size + 1) if not _allowed >> (k - 1) & 1]
+        if _not_allowed:
+            m += pl.lpSum(x[a][b][k - 1]
+                          for a, b in _coords
+                          for k in _not_allowed) == 0, f'combo({i})'
+        if len(_coords) < 2:
+            continue
+        # digits in every combination are used exactly once, the other digits at most once
+        # (already true by the rows, cols and regions if the cage is inside one of them)
+        _required = required_mask(sum_group['sum'], len(_coords), 0, size)
+        _one_unit = (len(set(a for a, _ in _coords)) == 1 or len(set(b for _, b in _coords)) == 1
+                     or len(set(region_of[coord] for coord in _coords)) == 1)
+        for k in range(1, size + 1):
+            if _required >> (k - 1) & 1:
+                m += pl.lpSum(x[a][b][k - 1] for a, b in _coords) == 1, f'required({i})_({k})'
+            elif _allowed >> (k - 1) & 1 and not _one_unit:
+                m += pl.lpSum(x[a][b][k - 1] for a, b in _coords) <= 1, f'distinct({i})_({k})'
 
     for known_number in json_data['known_numbers']:
         if not known_number['small']:
             a, b = known_number['coord']
             k = known_number['possible_numbers'][0]
-            m += x[str(a) + str(b) + str(k)] == 1
+            m += x[a][b][k - 1] == 1
+
+    _warm_start = False
+    if hints:
+        for x_i in x:  # the shared variables still hold the last solution
+            for x_ij in x_i:
+                for x_ijk in x_ij:
+                    x_ijk.varValue = None
+        for hint in hints:
+            a, b = hint['coord']
+            if hint['small'] and hint['possible_numbers']:
+                _excluded = [k for k in range(1, size + 1) if k not in hint['possible_numbers']]
+                if _excluded:
+                    m += pl.lpSum(x[a][b][k - 1] for k in _excluded) == 0, f'hint_{a}_{b}'
+            elif not hint['small']:
+                x[a][b][hint['possible_numbers'][0] - 1].setInitialValue(1)
+                _warm_start = True
+
+    if time_limit is not None and 'timeLimit' not in solver_cfg:
+        solver_cfg = dict(solver_cfg, timeLimit=time_limit)
+    solver = pl.getSolverFromDict(dict(solver_cfg, warmStart=True) if _warm_start else solver_cfg)
 
     # m.writeLP('sudoku.lp')
     tic = time.time()
     m.solve(solver=solver)
-    print('Solve Time: ' + str(time.time() - tic))
+    toc = time.time()
+    print('Solve Time: ' + str(toc - tic))
+    if stats is not None:
+        stats.update(build_time=tic - tic_build,
+                     solve_time=toc - tic,
+                     solver_status=pl.LpStatus[m.status],
+                     nodes=mip_node_count(solver))
 
     known_nbrs = []
+    if m.status != pl.LpStatusOptimal:  # the shared variables may still hold the values of the last solve
+        return known_nbrs
 
-    for i in range(9):
-        for j in range(9):
-            for k in range(1, 10):
-                var_id = str(i) + str(j) + str(k)
-                if pl.value(x[var_id]) is None:
+    for i in range(size):
+        for j in range(size):
+            for k in range(1, size + 1):
+                if x[i][j][k - 1].varValue is None:
                     continue
-                if pl.value(x[var_id]) > 0.9:
+                if x[i][j][k - 1].varValue > 0.9:
                     known_nbrs.append({'coord': (i, j),
                                        'small': False,
                                        'possible_numbers': [k]})
 
+    if stats is not None:
+        stats['extract_time'] = time.time() - toc
     return known_nbrs
+
+
+def mip_node_count(solver):
+    """
+    the number of branch and bound nodes, only the in-process solvers tell it (e.g. GUROBI, HiGHS)
+
+    :param solver: the pulp solver after solving
+    :return: the node count, None if unknown
+    """
+    solver_model = getattr(solver, 'solverModel', None)
+    if solver_model is None:
+        return None
+    try:
+        return int(solver_model.NodeCount)  # gurobipy
+    except (AttributeError, TypeError, ValueError):
+        pass
+    try:
+        return int(solver_model.getInfo().mip_node_count)  # highspy
+    except (AttributeError, TypeError, ValueError):
+        return None